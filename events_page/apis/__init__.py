@@ -1,9 +1,21 @@
 #!/usr/bin/env python
 import os
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
 
 import google.auth
+import google.auth.transport.requests
+import google_auth_httplib2
 from google.auth import impersonated_credentials
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import build_http as build_base_http
+from logzero import logger
+
+from apis import replay
+from apis.http_cache import ConditionalHttp, http_cache_enabled
 
 DEFAULT_SCOPES = [
     "https://www.googleapis.com/auth/calendar.readonly",
@@ -12,22 +24,169 @@ DEFAULT_SCOPES = [
 ]
 
 
+# Refresh cached credentials this far ahead of their expiry so no request stalls on minting a new token
+CREDENTIALS_REFRESH_MARGIN = timedelta(minutes=5)
+IMPERSONATED_CREDENTIALS_LIFETIME_SECS = 3600
+
+_credentials_lock = threading.RLock()
+_default_credentials_cache = {}
+_credentials_cache = {}
+
+
+def scopes_key(scopes):
+    return tuple(sorted(scopes or []))
+
+
+def load_default_credentials(scopes=None):
+    """Application default credentials (and project) for the given scopes, resolved once per process."""
+    with _credentials_lock:
+        key = scopes_key(scopes)
+        if key not in _default_credentials_cache:
+            _default_credentials_cache[key] = google.auth.default(scopes=scopes)
+        credentials, project = _default_credentials_cache[key]
+        refresh_if_expiring(credentials)
+        return credentials, project
+
+
+def refresh_if_expiring(credentials):
+    expiry = getattr(credentials, "expiry", None)
+    if not credentials.token or expiry is None:
+        # Never used yet (minted on first request) or non-expiring
+        return
+    if expiry - datetime.utcnow() < CREDENTIALS_REFRESH_MARGIN:
+        logger.debug(f"Refreshing credentials ahead of {expiry=}")
+        credentials.refresh(google.auth.transport.requests.Request())
+
+
 def load_credentials(scopes=DEFAULT_SCOPES):
-    credentials, _ = google.auth.default(scopes=scopes)
-    if sa_email := os.getenv("EVENTS_PAGE_SA_EMAIL"):
-        source_credentials = credentials
-        target_principal = sa_email
-        credentials = impersonated_credentials.Credentials(
-            source_credentials=source_credentials,
-            target_principal=target_principal,
-            target_scopes=scopes,
-            lifetime=500,
+    if replay.get_replay_mode() == replay.REPLAY_MODE:
+        # Replayed responses are served locally; no need to (or ability to) authenticate
+        return None
+    target_principal = os.getenv("EVENTS_PAGE_SA_EMAIL")
+    key = (scopes_key(scopes), target_principal)
+    with _credentials_lock:
+        if key not in _credentials_cache:
+            credentials, _ = load_default_credentials(scopes)
+            if target_principal:
+                credentials = impersonated_credentials.Credentials(
+                    source_credentials=credentials,
+                    target_principal=target_principal,
+                    target_scopes=scopes,
+                    lifetime=IMPERSONATED_CREDENTIALS_LIFETIME_SECS,
+                )
+            _credentials_cache[key] = credentials
+        credentials = _credentials_cache[key]
+        refresh_if_expiring(credentials)
+        return credentials
+
+
+def build_http(credentials=None, scopes=DEFAULT_SCOPES):
+    replay_mode = replay.get_replay_mode()
+    if replay_mode == replay.REPLAY_MODE:
+        return replay.ReplayHttp()
+
+    if credentials is None:
+        credentials = load_credentials(scopes)
+    http = google_auth_httplib2.AuthorizedHttp(credentials, http=build_base_http())
+    if replay_mode == replay.RECORD_MODE:
+        # Fixtures need full response bodies, so recording bypasses the conditional request cache
+        http = replay.RecordingHttp(http)
+    elif http_cache_enabled():
+        http = ConditionalHttp(http)
+    return http
+
+
+_thread_local = threading.local()
+
+
+def get_thread_http(service):
+    """Return a transport for use with a shared service from the current thread.
+
+    httplib2.Http instances are not thread-safe, so concurrent requests need one per thread.
+    """
+    thread_https = _thread_local.__dict__.setdefault("https", {})
+    if id(service) not in thread_https:
+        thread_https[id(service)] = build_http(
+            credentials=getattr(service._http, "credentials", None)
+        )
+    return thread_https[id(service)]
+
+
+_service_registry_lock = threading.Lock()
+_service_registry = {}
+_service_registry_stats = {}
+
+
+def current_rss_kib():
+    """Resident set size of this process, or None where /proc is unavailable (e.g., macOS)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024
+
+
+@lru_cache(maxsize=None)
+def get_discovery_document(service_name, version):
+    # Discovery documents bundled with googleapiclient; never fetched over the network
+    document = get_static_doc(service_name, version)
+    if document is None:
+        raise Exception(f"No bundled discovery document for {service_name=} {version=}")
+    return document
+
+
+def build_service(service_name, version, scopes=DEFAULT_SCOPES, credentials=None):
+    """Return this process' shared client for the given API, constructing it on first use."""
+    principal = id(credentials) if credentials else os.getenv("EVENTS_PAGE_SA_EMAIL")
+    key = (
+        service_name,
+        version,
+        scopes_key(scopes),
+        principal,
+        replay.get_replay_mode(),
+    )
+    with _service_registry_lock:
+        stats = _service_registry_stats.setdefault(
+            key[:2], dict(builds=0, reuses=0, build_secs=0.0, build_kib=None)
+        )
+        if key in _service_registry:
+            stats["reuses"] += 1
+            return _service_registry[key]
+
+        # An RSS delta (rather than tracing allocations) is cheap enough to take on every build
+        rss_before = current_rss_kib()
+        build_start = time.perf_counter()
+        service = build_from_document(
+            get_discovery_document(service_name, version),
+            http=build_http(credentials=credentials, scopes=scopes),
         )
-    return credentials
+        stats["build_secs"] += time.perf_counter() - build_start
+        if rss_before is not None:
+            stats["build_kib"] = (stats["build_kib"] or 0.0) + max(
+                current_rss_kib() - rss_before, 0.0
+            )
+        stats["builds"] += 1
+        _service_registry[key] = service
+        return service
 
 
-def build_service(service_name, version, scopes):
-    return build(service_name, version, credentials=load_credentials(scopes))
+def get_service_registry_report():
+    """Per-API build costs and what reusing shared clients saved versus building one per call."""
+    report = {}
+    with _service_registry_lock:
+        for (service_name, version), stats in _service_registry_stats.items():
+            builds = max(stats["builds"], 1)
+            report[f"{service_name}/{version}"] = dict(
+                stats,
+                saved_secs=round(stats["build_secs"] / builds * stats["reuses"], 4),
+                saved_kib=(
+                    None
+                    if stats["build_kib"] is None
+                    else round(stats["build_kib"] / builds * stats["reuses"], 1)
+                ),
+            )
+    return report
 
 
 class Singleton(type):
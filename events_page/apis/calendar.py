@@ -1,25 +1,53 @@
 #!/usr/bin/env python
 import base64
+import json
+import os
 import re
+import tempfile
 import time
 from datetime import datetime, timedelta
-from functools import partial
 from os.path import basename
 from urllib.parse import quote_plus
 from zoneinfo import ZoneInfo
 
 from config import cfg
 from dateutil.parser import parse
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from logzero import setup_logger
 
-from apis import load_credentials
+from apis import build_service as build_api_service
+from apis import replay
 from apis.constants import CalendarColors
 from apis.drive import get_local_path_for_file
 from apis.mls import TeamColors
 
 logger = setup_logger(name=__name__)
 
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+SYNC_STATE_PATH = os.path.abspath(
+    os.path.join(BASE_DIR, "..", ".sync_state", "calendar_events.json")
+)
+# Full syncs fetch a little past the requested window so that the daily-advancing
+# time_max stays covered by the stored event set (and its sync token) for a while.
+SYNC_WINDOW_PADDING = timedelta(days=30)
+# The only raw event fields Event reads; the sync state keeps just these (rather than every field the API returns)
+SYNC_STATE_EVENT_FIELDS = (
+    "id",
+    "summary",
+    "htmlLink",
+    "colorId",
+    "location",
+    "description",
+    "start",
+    "end",
+    "attachments",
+)
+MAX_PAGE_SIZE = 2500
+
+# Shared by every Event rather than rebuilt per event
+MLS_TEAM_ABBRS_BY_NAME = TeamColors().team_abbrs_by_name()
+EMPTY_CATEGORY = dict()
+
 
 def load_calendar(service, calendar_id):
     calendar = Calendar(
@@ -32,20 +60,76 @@ def load_calendar(service, calendar_id):
     # TODO: Should actually probably pull events <=24 hours ago start time so we don't drop events right after they start....
     events_time_min = datetime.utcnow().isoformat() + "Z"  # 'Z' indicates UTC time
     events_time_max = (datetime.utcnow() + timedelta(days=365)).isoformat() + "Z"
+    sync_state_path = (
+        SYNC_STATE_PATH if cfg.calendar_sync_mode == "incremental" else None
+    )
+    if sync_state_path is not None and replay.get_replay_mode() is not None:
+        # Sync tokens advance with every run, so a token stored after recording would never match a fixture
+        logger.info(
+            "Recording / replaying HTTP fixtures, loading calendar events without incremental sync..."
+        )
+        sync_state_path = None
     calendar.load_events(
         time_min=events_time_min,
         time_max=events_time_max,
+        sync_state_path=sync_state_path,
     )
     return calendar
 
 
+def load_sync_state(state_path):
+    if not os.path.exists(state_path):
+        return None
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as err:
+        logger.warning(f"Unable to read calendar sync state at {state_path=}: {err=}")
+        return None
+
+
+def slim_raw_event(raw_event):
+    return {k: raw_event[k] for k in SYNC_STATE_EVENT_FIELDS if k in raw_event}
+
+
+def save_sync_state(state_path, state):
+    state_dir = os.path.dirname(state_path)
+    os.makedirs(state_dir, exist_ok=True)
+    # Write to a temporary file first so an interrupted build never leaves a truncated state file behind
+    with tempfile.NamedTemporaryFile(
+        "w", dir=state_dir, delete=False, encoding="utf-8"
+    ) as f:
+        json.dump(state, f)
+    os.replace(f.name, state_path)
+
+
 def build_service(credentials=None):
-    if credentials is None:
-        credentials = load_credentials()
-    return build("calendar", "v3", credentials=credentials)
+    return build_api_service("calendar", "v3", credentials=credentials)
 
 
 class Event(object):
+    """Compact, pre-parsed representation of a single calendar event.
+
+    All fields are normalized once from the API payload; lookup tables (categories, team abbreviations) are shared
+    references rather than per-event copies.
+    """
+
+    __slots__ = (
+        "id",
+        "summary",
+        "html_link",
+        "color_id",
+        "location",
+        "description",
+        "start_dt",
+        "end_dt",
+        "display_timezone",
+        "category",
+        "cover_image_attachment",
+        "is_over_zoom",
+        "match_slug",
+    )
+
     today = datetime.today()
     zoom_url_regexp = re.compile(r"https://[a-zA-Z0-9]+\.zoom.us\/.*")
     game_regexp = re.compile(r"Austin FC (?P<vsat>vs|at) (?P<opponent>.*)")
@@ -56,63 +140,51 @@ class Event(object):
         display_timezone,
         categories_by_color_id,
     ) -> None:
-        self._event = raw_event
+        self.id = raw_event.get("id")
+        self.summary = raw_event.get("summary", "")
+        self.html_link = raw_event.get("htmlLink", "")
+        self.color_id = raw_event.get("colorId", "0")
+        self.location = raw_event.get("location", "")
+        self.description = raw_event.get("description", "")
         self.display_timezone = display_timezone
-        self.categories_by_color_id = categories_by_color_id
-        self.mls_team_abbrs_by_name = TeamColors().team_abbrs_by_name()
+
+        tzinfo = ZoneInfo(display_timezone)
+        self.start_dt = parse_event_timestamp(raw_event, "start", tzinfo)
+        self.end_dt = parse_event_timestamp(raw_event, "end", tzinfo)
+
+        self.category = categories_by_color_id.get(self.color_id) or EMPTY_CATEGORY
 
         self.cover_image_attachment = None
-        for attachment in self._event.get("attachments", []):
+        for attachment in raw_event.get("attachments", []):
             if attachment["mimeType"].startswith("image/"):
                 self.cover_image_attachment = attachment
                 break
 
+        self.is_over_zoom = bool(self.zoom_url_regexp.match(self.location))
+
+        self.match_slug = None
+        if summary_match := self.game_regexp.match(self.summary):
+            groups = summary_match.groupdict()
+            opp_abbr = MLS_TEAM_ABBRS_BY_NAME.get(groups["opponent"], "-")
+            if groups["vsat"] == "vs":
+                self.match_slug = f"atxvs{opp_abbr}"
+            else:
+                self.match_slug = f"{opp_abbr}vsatx"
+
     def get(self, key, default=None):
         try:
             return getattr(self, key)
         except AttributeError:
             return default
 
-    def __getattr__(self, key):
-        if value := self._event.get(key):
-            return value
-        # convert key from snake to camel case
-        components = key.split("_")
-        # via: https://stackoverflow.com/a/19053800
-        # We capitalize the first letter of each component except the first one
-        # with the 'title' method and join them together.
-        camelKey = components[0] + "".join(x.title() for x in components[1:])
-        if value := self._event.get(camelKey):
-            return value
-
-        raise AttributeError(f"no {key=} in <Event raw_event... >")
-
     @property
-    def category(self):
-        # logger.debug(
-        #     f"{self.summary} ===>\n{self.color_id=} => {self.categories_by_color_id.get(self.color_id)=}"
-        # )
-        if category := self.categories_by_color_id.get(self.color_id):
-            return category
-
-        return dict()
+    def htmlLink(self):
+        return self.html_link
 
     @property
     def category_name(self):
         return self.category.get("category_name", "misc")
 
-    @property
-    def color_id(self):
-        return self._event.get("colorId", "0")
-
-    @property
-    def start_dt(self):
-        return self.parse_event_timestamp(self._event, "start")
-
-    @property
-    def end_dt(self):
-        return self.parse_event_timestamp(self._event, "end")
-
     @property
     def in_past(self):
         return self.start_dt < self.today.replace(
@@ -134,26 +206,14 @@ class Event(object):
     def has_location(self):
         return bool(self.location)
 
-    @property
-    def location(self):
-        return self._event.get("location", "")
-
     @property
     def has_description(self):
         return bool(self.description)
 
-    @property
-    def description(self):
-        return self._event.get("description", "")
-
     @property
     def description_lines(self):
         return self.description.split("\n")
 
-    @property
-    def is_over_zoom(self):
-        return bool(self.zoom_url_regexp.match(self.location))
-
     @property
     def cover_image_filename(self):
         if not self.cover_image_attachment:
@@ -169,39 +229,31 @@ class Event(object):
 
     @property
     def is_match(self):
-        return self.game_regexp.match(self.summary) is not None
+        return self.match_slug is not None
 
-    @property
-    def match_slug(self):
-        if summary_match := self.game_regexp.match(self.summary):
-            groups = summary_match.groupdict()
-            opp_abbr = self.mls_team_abbrs_by_name.get(groups["opponent"], "-")
-            if groups["vsat"] == "vs":
-                return f"atxvs{opp_abbr}"
-            else:
-                return f"{opp_abbr}vsatx"
-        return None
 
-    def parse_event_timestamp(self, event, timestamp_key):
-        parsed_dt = parse(
-            event[timestamp_key].get("dateTime", event[timestamp_key].get("date"))
-        )
-        parsed_dt = parsed_dt.replace(tzinfo=ZoneInfo(self.display_timezone))
-        return parsed_dt
+def parse_event_timestamp(raw_event, timestamp_key, tzinfo):
+    timestamp = raw_event[timestamp_key]
+    timestamp = timestamp.get("dateTime", timestamp.get("date"))
+    try:
+        # fromisoformat() is much cheaper than dateutil and handles everything the API emits aside from "Z" suffixes
+        parsed_dt = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except ValueError:
+        parsed_dt = parse(timestamp)
+    return parsed_dt.replace(tzinfo=tzinfo)
 
 
 class Calendar(object):
-    # Lazy caching by way of class attribute:
-    events = None
-    events_time_min = None
-    events_time_max = None
-    last_refresh = None
-
     today = datetime.today()
 
     def __init__(
         self, service, calendar_id, display_timezone, event_categories
     ) -> None:
+        # Events are loaded once per Calendar instance; share the instance (e.g., via a BuildContext) to reuse them
+        self.events = None
+        self.events_time_min = None
+        self.events_time_max = None
+        self.last_refresh = None
         self._service = service
         self.calendar_id = calendar_id
         self.display_timezone = display_timezone
@@ -263,37 +315,179 @@ class Calendar(object):
         self,
         time_min,
         time_max,
+        sync_state_path=None,
+        page_size=None,
     ):
+        """Load the window's events one page of API results at a time.
+
+        Only a single raw page is held while fetching; what is retained is the resulting list of Event objects
+        (which every page of the site renders from) and, when syncing, the slimmed-down sync state.
+        """
         if self.events is not None:
             return self.events
 
         self.events_time_min = time_min
         self.events_time_max = time_max
         self.last_refresh = datetime.now(tz=ZoneInfo(cfg.display_timezone))
-        logger.info(f"Getting the all events from {time_min} to {time_max}...")
 
-        events_result = (
-            self._service.events()
-            .list(
-                calendarId=self.calendar_id,
-                timeMin=time_min,
-                timeMax=time_max,
-                # maxResults=10,
-                singleEvents=True,
-                orderBy="startTime",
+        if sync_state_path is not None:
+            events = self.sync_events(time_min, time_max, sync_state_path, page_size)
+            self.events = [self.new_event(e) for e in events]
+            return self.events
+
+        self.events = list(self.iter_events(time_min, time_max, page_size))
+        return self.events
+
+    def new_event(self, raw_event):
+        return Event(
+            raw_event,
+            display_timezone=self.display_timezone,
+            categories_by_color_id=self.categories_by_color_id,
+        )
+
+    def iter_events(self, time_min, time_max, page_size=None):
+        """Yield Event objects for the window one page of API results at a time."""
+        logger.info(f"Getting the all events from {time_min} to {time_max}...")
+        for response in self.iter_event_pages(
+            page_size=page_size,
+            timeMin=time_min,
+            timeMax=time_max,
+            singleEvents=True,
+            orderBy="startTime",
+        ):
+            for raw_event in response.get("items", []):
+                yield self.new_event(raw_event)
+
+    def iter_event_pages(self, page_size=None, **list_kwargs):
+        if page_size is None:
+            page_size = cfg.calendar_page_size
+        # The Calendar API silently caps maxResults at 2500 (defaulting to 250 when omitted)
+        page_size = min(int(page_size), MAX_PAGE_SIZE)
+        request = self._service.events().list(
+            calendarId=self.calendar_id,
+            maxResults=page_size,
+            **list_kwargs,
+        )
+        page_num = 0
+        while request is not None:
+            response = request.execute()
+            page_num += 1
+            logger.debug(
+                f"events().list() page {page_num}: {len(response.get('items', []))} items"
+            )
+            yield response
+            request = self._service.events().list_next(request, response)
+
+    def sync_events(self, time_min, time_max, sync_state_path, page_size=None):
+        """Return the raw events within the window, applying only the changes since the last sync when possible."""
+        state = load_sync_state(sync_state_path)
+        if not self.sync_state_covers_window(state, time_min, time_max):
+            state = self.full_sync(time_min, time_max, page_size)
+        else:
+            try:
+                state = self.incremental_sync(state, page_size)
+            except HttpError as err:
+                if err.resp.status != 410:
+                    raise
+                logger.warning(
+                    f"Sync token for {self.calendar_id=} no longer valid ({err=}), performing a full resync..."
+                )
+                state = self.full_sync(time_min, time_max, page_size)
+        save_sync_state(sync_state_path, state)
+
+        window_min, window_max = parse(time_min), parse(time_max)
+        events = [
+            e
+            for e in state["events"].values()
+            if self.event_overlaps_window(e, window_min, window_max)
+        ]
+        events.sort(key=lambda e: self.parse_raw_timestamp(e, "start"))
+        return events
+
+    def sync_state_covers_window(self, state, time_min, time_max):
+        if not state or not state.get("sync_token"):
+            return False
+        if state.get("calendar_id") != self.calendar_id:
+            logger.info(
+                f"Calendar sync state is for {state.get('calendar_id')=}, not {self.calendar_id=}..."
             )
-            .execute()
+            return False
+        covered = parse(state["time_min"]) <= parse(time_min) and parse(
+            time_max
+        ) <= parse(state["time_max"])
+        if not covered:
+            logger.info(
+                f"Calendar sync state window ({state['time_min']} to {state['time_max']}) does not cover {time_min} to {time_max}..."
+            )
+        return covered
+
+    def full_sync(self, time_min, time_max, page_size=None):
+        padded_time_max = (parse(time_max) + SYNC_WINDOW_PADDING).isoformat()
+        logger.info(
+            f"Performing a full sync of all events from {time_min} to {padded_time_max}..."
         )
-        events = events_result.get("items", [])
-        if not events:
-            return []
-        new_event = partial(
-            Event,
-            categories_by_color_id=self.categories_by_color_id,
-            display_timezone=self.display_timezone,
+        events = {}
+        # orderBy is not permitted alongside sync tokens, so events are sorted locally instead
+        sync_token, _ = self.merge_event_pages(
+            events,
+            page_size=page_size,
+            timeMin=time_min,
+            timeMax=padded_time_max,
+            singleEvents=True,
         )
-        self.events = [new_event(e) for e in events]
-        return self.events
+        return dict(
+            calendar_id=self.calendar_id,
+            time_min=time_min,
+            time_max=padded_time_max,
+            sync_token=sync_token,
+            events=events,
+        )
+
+    def incremental_sync(self, state, page_size=None):
+        logger.info(
+            f"Performing an incremental sync of events for {self.calendar_id=} since last sync..."
+        )
+        sync_token, num_changes = self.merge_event_pages(
+            state["events"],
+            page_size=page_size,
+            syncToken=state["sync_token"],
+            singleEvents=True,
+        )
+        logger.info(f"Applied {num_changes} changed events to calendar sync state")
+        state["sync_token"] = sync_token
+        return state
+
+    def merge_event_pages(self, events, page_size=None, **list_kwargs):
+        """Apply each page of events().list() results to events (keyed by ID) as it arrives.
+
+        Returns (next sync token, number of events changed).
+        """
+        sync_token = None
+        num_changes = 0
+        for response in self.iter_event_pages(page_size=page_size, **list_kwargs):
+            for item in response.get("items", []):
+                if item.get("status") == "cancelled":
+                    events.pop(item["id"], None)
+                else:
+                    events[item["id"]] = slim_raw_event(item)
+                num_changes += 1
+            # nextSyncToken is only included on the final page of results
+            sync_token = response.get("nextSyncToken", sync_token)
+        return sync_token, num_changes
+
+    def event_overlaps_window(self, raw_event, window_min, window_max):
+        # Mirrors the events().list timeMin / timeMax semantics: end after time_min, start before time_max
+        return (
+            self.parse_raw_timestamp(raw_event, "end") > window_min
+            and self.parse_raw_timestamp(raw_event, "start") < window_max
+        )
+
+    def parse_raw_timestamp(self, raw_event, timestamp_key):
+        timestamp = raw_event[timestamp_key]
+        parsed_dt = parse(timestamp.get("dateTime", timestamp.get("date")))
+        if parsed_dt.tzinfo is None:
+            parsed_dt = parsed_dt.replace(tzinfo=ZoneInfo(self.display_timezone))
+        return parsed_dt
 
 
 def ensure_watch(
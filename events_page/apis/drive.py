@@ -3,22 +3,29 @@ import io
 import mimetypes
 import os
 import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from config import cfg
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload
 from logzero import logger
 
-from apis import load_credentials
+from apis import build_service as build_api_service
+from apis import get_thread_http
+from apis.image_cache import ImageCache
 
 BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+DRIVE_FILE_URI_REGEXP = re.compile(
+    r"https://drive.google.com/file/d/(?P<file_id>[^?]+)/.*"
+)
+FILE_METADATA_FIELDS = "id, name, mimeType, md5Checksum, modifiedTime, size"
+# Drive batch requests are limited to 100 calls each
+MAX_BATCH_SIZE = 100
 
 
 def build_service(credentials=None):
-    if credentials is None:
-        credentials = load_credentials()
-    return build("drive", "v3", credentials=credentials)
+    return build_api_service("drive", "v3", credentials=credentials)
 
 
 def get_local_path_from_file_id(service, file_id):
@@ -38,35 +45,115 @@ def get_local_path_for_file(file_id, mime_type=None):
     )
 
 
-def download_event_images(service, events):
+def get_event_image_attachments_by_file_id(events):
+    # Recurring events share attachments; only fetch each file once
+    attachments_by_file_id = defaultdict(list)
+    for event in events:
+        if event.cover_image_attachment is not None:
+            attachment = event.cover_image_attachment
+            attachments_by_file_id[attachment["fileId"]].append(attachment)
+    return attachments_by_file_id
+
+
+def get_files_metadata(service, file_ids):
+    """Look up metadata for many files via Drive batch requests; files that fail to resolve are omitted."""
+    file_ids = list(dict.fromkeys(file_ids))
+    files_metadata = {}
+
+    def handle_response(request_id, response, exception):
+        if exception is not None:
+            logger.warning(
+                f"Unable to retrieve metadata for {request_id=}: {exception}"
+            )
+            return
+        files_metadata[request_id] = response
+
+    for batch_start in range(0, len(file_ids), MAX_BATCH_SIZE):
+        batch_file_ids = file_ids[batch_start : batch_start + MAX_BATCH_SIZE]  # noqa
+        logger.debug(f"Requesting metadata for {len(batch_file_ids)} files in a batch")
+        batch = service.new_batch_http_request(callback=handle_response)
+        for file_id in batch_file_ids:
+            batch.add(
+                service.files().get(fileId=file_id, fields=FILE_METADATA_FIELDS),
+                request_id=file_id,
+            )
+        batch.execute()
+    logger.info(f"Retrieved metadata for {len(files_metadata)}/{len(file_ids)} files")
+    return files_metadata
+
+
+def download_event_images(
+    service, events, files_metadata=None, max_workers=None, image_cache=None
+):
+    if max_workers is None:
+        max_workers = int(cfg.drive_download_workers)
+    if image_cache is None:
+        image_cache = ImageCache()
+
+    attachments_by_file_id = get_event_image_attachments_by_file_id(events)
+    if files_metadata is None:
+        files_metadata = get_files_metadata(service, attachments_by_file_id)
+
+    missing_file_ids = set(attachments_by_file_id) - set(files_metadata)
+    for file_id in missing_file_ids:
+        logger.warning(f"No metadata found for {file_id=}, skipping its download...")
+    # Otherwise the styles / pages would still point these events at an image that never gets written
+    for event in events:
+        attachment = event.cover_image_attachment
+        if attachment is not None and attachment["fileId"] in missing_file_ids:
+            logger.warning(f"Dropping cover image from event {event.id=}")
+            event.cover_image_attachment = None
+
+    image_files = []
+    for file_id, attachments in attachments_by_file_id.items():
+        if file_id in missing_file_ids:
+            continue
+        image_file = dict(files_metadata[file_id])
+        for attachment in attachments:
+            attachment.update(image_file)
+        image_files.append(image_file)
+    logger.info(
+        f"Downloading {len(image_files)} unique event images with {max_workers=}..."
+    )
+
     downloaded_images = {}
-    image_files = [
-        e.cover_image_attachment for e in events if e.cover_image_attachment is not None
-    ]
-    for image_file in image_files:
-        image_file.update(service.files().get(fileId=image_file["fileId"]).execute())
-        download_image(service, image_file)
-        downloaded_images[image_file["name"]] = os.path.basename(
-            image_file["local_path"]
-        )
-    logger.debug(f"download_all_images_in_folder() => {image_files=}")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_image, service, image_file, image_cache): image_file[
+                "id"
+            ]
+            for image_file in image_files
+        }
+        for future in as_completed(futures):
+            image_file = future.result()
+            for attachment in attachments_by_file_id[futures[future]]:
+                attachment["local_path"] = image_file["local_path"]
+            downloaded_images[image_file["name"]] = os.path.basename(
+                image_file["local_path"]
+            )
+    logger.debug(f"download_event_images() => {downloaded_images=}")
     return downloaded_images
 
 
-def download_image(service, image_file):
+def fetch_image(service, image_file, image_cache):
+    return download_image(
+        service, image_file, http=get_thread_http(service), image_cache=image_cache
+    )
+
+
+def download_image(service, image_file, http=None, image_cache=None):
+    if image_cache is None:
+        image_cache = ImageCache()
     image_file["local_path"] = get_local_path_for_file(
         image_file["id"], image_file["mimeType"]
     )
-    if os.path.exists(image_file["local_path"]):
-        logger.debug(
-            f"{image_file['name']} already present on disk ({image_file['local_path']=}! Skipping download..."
-        )
-        return image_file
+
+    def download():
+        fh = download_file_id(service=service, file_id=image_file["id"], http=http)
+        return fh.getvalue()
 
     try:
-        fh = download_file_id(service=service, file_id=image_file["id"])
-        with open(image_file["local_path"], "wb") as f:
-            f.write(fh.getbuffer())
+        image_cache.ensure_local(image_file, download)
     except HttpError as error:
         # TODO(developer) - Handle errors from drive API.
         logger.exception(f"An error occurred: {error}")
@@ -74,8 +161,10 @@ def download_image(service, image_file):
     return image_file
 
 
-def download_file_id(service, file_id):
+def download_file_id(service, file_id, http=None):
     request = service.files().get_media(fileId=file_id)
+    if http is not None:
+        request.http = http
     fd = io.BytesIO()
     downloader = MediaIoBaseDownload(fd, request)
     done = False
@@ -101,28 +190,46 @@ def list_files(service, q):
     return file_list_resp
 
 
-def add_category_image_file_metadata(drive_service, event_categories):
+def get_category_image_file_id(event_category):
+    default_cover_image = event_category.get("default_cover_image") or ""
+    if cover_image_uri_matches := DRIVE_FILE_URI_REGEXP.match(default_cover_image):
+        return cover_image_uri_matches.groupdict()["file_id"]
+    return None
+
+
+def add_category_image_file_metadata(
+    drive_service, event_categories, files_metadata=None
+):
+    category_file_ids = {
+        name: get_category_image_file_id(c) for name, c in event_categories.items()
+    }
+    if files_metadata is None:
+        files_metadata = get_files_metadata(
+            drive_service, [i for i in category_file_ids.values() if i]
+        )
+
     parsed_categories = dict()
-    uri_regexp = re.compile(r"https://drive.google.com/file/d/(?P<file_id>[^?]+)/.*")
     for name, event_category in event_categories.items():
-        default_cover_image = event_category.get("default_cover_image", "")
-        if default_cover_image is not None and uri_regexp.match(default_cover_image):
-            if cover_image_uri_matches := uri_regexp.match(default_cover_image):
-                cover_image_file_id = cover_image_uri_matches.groupdict()["file_id"]
+        if cover_image_file_id := category_file_ids[name]:
+            if cover_image_file_id in files_metadata:
                 logger.debug(
-                    f"category {name}: downloading file metadata for {cover_image_file_id}"
+                    f"category {name}: adding file metadata for {cover_image_file_id}"
+                )
+                event_category["file_metadata"] = dict(
+                    files_metadata[cover_image_file_id]
                 )
-                event_category["file_metadata"] = (
-                    drive_service.files()
-                    .get(fileId=cover_image_file_id)
-                    .execute()
+            else:
+                logger.warning(
+                    f"category {name}: no file metadata found for {cover_image_file_id}"
                 )
         parsed_categories[name] = event_category
 
     return parsed_categories
 
 
-def download_category_images(drive_service, event_categories):
+def download_category_images(drive_service, event_categories, image_cache=None):
+    if image_cache is None:
+        image_cache = ImageCache()
     downloaded_images = {}
     for name, event_category in event_categories.items():
         if "file_metadata" not in event_category:
@@ -133,6 +240,7 @@ def download_category_images(drive_service, event_categories):
         image_file = download_image(
             drive_service,
             event_category["file_metadata"],
+            image_cache=image_cache,
         )
 
         local_path = os.path.basename(image_file["local_path"])
@@ -1,47 +1,143 @@
 #!/usr/bin/env python
+import io
+import threading
+from datetime import datetime, timedelta, timezone
+from urllib.error import HTTPError
+from urllib.parse import quote
+
+import requests
 from fastcore.basics import AttrDict
 from fastcore.net import ExceptionsHTTP
-from ghapi.all import GhApi
+from fastcore.utils import dict2obj
+from ghapi.all import GH_HOST, GhApi
 from github3 import GitHub
 from logzero import logger
 from tenacity import retry
 from tenacity.stop import stop_after_attempt
 from tenacity.wait import wait_fixed
 
+# Installation tokens are valid for an hour; mint a new one once the current one is this close to expiring
+INSTALLATION_TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+_github_lock = threading.Lock()
+_installation_tokens = {}
+_github_clients = {}
+# Last list_workflow_runs response (and its ETag) per workflow, for revalidating with If-None-Match
+_workflow_runs_cache = {}
+
 
 class SuperfluousDispatchException(Exception):
     pass
 
 
+class PooledGhApi(GhApi):
+    """GhApi sending its requests through a shared requests.Session, so connections are kept alive and reused.
+
+    (GhApi itself opens a new urllib connection per call.) Errors are raised as the same fastcore / urllib
+    HTTPError types GhApi would raise.
+    """
+
+    def __init__(self, *args, session=None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.session = session or requests.Session()
+
+    def __call__(
+        self, path, verb=None, headers=None, route=None, query=None, data=None
+    ):
+        if verb is None:
+            verb = "POST" if data else "GET"
+        headers = {**self.headers, **(headers or {})}
+        if path[:7] not in ("http://", "https:/"):
+            path = GH_HOST + path
+        if route:
+            path = path.format(**{k: quote(str(v)) for k, v in route.items()})
+        response = self.session.request(
+            verb, path, headers=headers, params=query or None, json=data or None
+        )
+        self.recv_hdrs = dict(response.headers)
+        if response.status_code == 304 or response.status_code >= 400:
+            fp = io.BytesIO(response.content)
+            if response.status_code in ExceptionsHTTP:
+                raise ExceptionsHTTP[response.status_code](path, response.headers, fp)
+            raise HTTPError(
+                path, response.status_code, response.reason, response.headers, fp
+            )
+        return dict2obj(response.json()) if response.content else AttrDict()
+
+
+def get_installation_token(app_id, app_key, install_id):
+    """Return an installation access token, only exchanging a new app JWT for one when ours is about to expire."""
+    cache_key = (app_id, install_id)
+    with _github_lock:
+        token_auth = _installation_tokens.get(cache_key)
+        if (
+            token_auth is None
+            or token_auth.expires_at - datetime.now(timezone.utc)
+            < INSTALLATION_TOKEN_REFRESH_MARGIN
+        ):
+            gh3 = GitHub()
+            gh3.login_as_app_installation(
+                app_key.encode("utf-8"), app_id, install_id, expire_in=300
+            )
+            gh_session = getattr(gh3, "session")
+            token_auth = getattr(gh_session, "auth")
+            logger.debug(f"Minted new installation token: {token_auth=}")
+            _installation_tokens[cache_key] = token_auth
+        return token_auth.token
+
+
 def get_github_client(owner, repo, app_id, app_key, install_id):
     logger.info(f"get_github_client() => {app_id=}, {app_key[-8:]=}, {install_id=}")
-    gh3 = GitHub()
-    gh3.login_as_app_installation(
-        app_key.encode("utf-8"), app_id, install_id, expire_in=300
-    )
-    gh_session = getattr(gh3, "session")
-    gh_session_auth = getattr(gh_session, "auth")
-    logger.debug(f"{gh_session_auth=}")
-    return GhApi(
-        owner=owner,
-        repo=repo,
-        token=getattr(gh_session_auth, "token"),
-    )
+    token = get_installation_token(app_id, app_key, install_id)
+    with _github_lock:
+        github_client = _github_clients.get((owner, repo))
+        if github_client is None:
+            github_client = PooledGhApi(owner=owner, repo=repo, token=token)
+            _github_clients[(owner, repo)] = github_client
+        github_client.headers["Authorization"] = f"token {token}"
+        return github_client
+
+
+def list_workflow_runs(github_client, workflow_filename: str) -> AttrDict:
+    """List a workflow's runs, reusing the previous response when GitHub reports it as not modified.
+
+    Conditional requests answered with a 304 do not count against GitHub's API rate limit.
+    """
+    cached = _workflow_runs_cache.get(workflow_filename)
+    headers = {"If-None-Match": cached[0]} if cached else None
+    try:
+        list_runs_resp = github_client.actions.list_workflow_runs(
+            workflow_id=workflow_filename, headers=headers
+        )
+    except HTTPError as err:
+        if err.code != 304 or cached is None:
+            raise
+        logger.debug(
+            f"{workflow_filename} workflow runs not modified since last listed"
+        )
+        return cached[1]
+
+    etag = {k.lower(): v for k, v in github_client.recv_hdrs.items()}.get("etag")
+    if etag:
+        _workflow_runs_cache[workflow_filename] = (etag, list_runs_resp)
+    return list_runs_resp
 
 
 def dispatch_build_workflow_run(
     github_client,
     workflow_filename: str,
     github_ref: str,
+    wait_for_run: bool = True,
 ) -> AttrDict:
-    """Class-scoped fixture that dispatches the build workflow and returns the resulting workflow run."""
+    """Class-scoped fixture that dispatches the build workflow and returns the resulting workflow run.
+
+    With wait_for_run=False, returns (None) as soon as the dispatch is accepted rather than polling for the run.
+    """
     # First get the full list of existing workflow runs (used subsequently to determine which workflow run is
     # dispatched as part of this 'build_suite_run').
     logger.debug(f"Grabbing extant workflow runs for {workflow_filename=}")
     try:
-        list_runs_resp = github_client.actions.list_workflow_runs(
-            workflow_id=workflow_filename
-        )
+        list_runs_resp = list_workflow_runs(github_client, workflow_filename)
         logger.debug(f"{list_runs_resp.total_count=}")
     except ExceptionsHTTP[404] as err:
         logger.error(
@@ -83,6 +179,8 @@ def dispatch_build_workflow_run(
         inputs=dispatch_inputs,
     )
     logger.info("Workflow dispatched")
+    if not wait_for_run:
+        return None
 
     logger.debug("Grabbing updated workflow runs list post-dispatch...")
     workflow_run = poll_for_workflow_run(
@@ -111,9 +209,7 @@ def poll_for_workflow_run(
     logger.debug(
         f"Grabbing workflow runs list, post dispatch, for {workflow_filename=}"
     )
-    list_runs_resp = github_client.actions.list_workflow_runs(
-        workflow_id=workflow_filename
-    )
+    list_runs_resp = list_workflow_runs(github_client, workflow_filename)
     logger.debug(f"{list_runs_resp.total_count=}")
 
     postdispatch_workflow_runs = {
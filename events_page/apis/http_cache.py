@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+"""Conditional request (ETag / If-None-Match) cache for Google API GET requests.
+
+Responses carrying an ETag are stored under EVENTS_PAGE_HTTP_CACHE_DIR; repeat requests revalidate with
+If-None-Match and a 304 is answered from the stored payload. This covers plain GETs (e.g., calendar event
+listings) as well as the GET parts of batch requests (e.g., Drive file metadata lookups). The least recently used
+entries are pruned once the cache outgrows EVENTS_PAGE_HTTP_CACHE_MAX_BYTES. Set EVENTS_PAGE_HTTP_CACHE_ENABLED to
+"false" to bypass the cache entirely.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import uuid
+from email.parser import FeedParser
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httplib2
+from logzero import logger
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_HTTP_CACHE_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", ".http_cache"))
+DEFAULT_HTTP_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# The events window is derived from the current time; keyed by day, a rebuild later the same day can revalidate
+DAY_NORMALIZED_QUERY_PARAMS = {"timeMin", "timeMax"}
+# Cursors into a particular listing; a later listing hands out different ones, so these are never requested twice
+UNREPEATABLE_QUERY_PARAMS = {"pageToken"}
+BATCH_PATH_PREFIX = "/batch/"
+# Hop-by-hop / framing headers that no longer apply once a cached payload is served
+UNREPLAYED_HEADERS = {"status", "content-length", "transfer-encoding"}
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def http_cache_enabled():
+    return os.getenv("EVENTS_PAGE_HTTP_CACHE_ENABLED", "true").lower() not in (
+        "0",
+        "false",
+        "no",
+    )
+
+
+def get_http_cache_dir():
+    return os.getenv("EVENTS_PAGE_HTTP_CACHE_DIR", DEFAULT_HTTP_CACHE_DIR)
+
+
+def get_http_cache_max_bytes():
+    return int(
+        os.getenv("EVENTS_PAGE_HTTP_CACHE_MAX_BYTES", DEFAULT_HTTP_CACHE_MAX_BYTES)
+    )
+
+
+def cache_key(uri):
+    """The key a GET for uri is cached under, or None if it is not worth caching.
+
+    Coarsening the key (e.g., to the day for timeMin / timeMax) is safe: cached payloads are only ever served
+    after the server answers 304, i.e., confirms its current response carries the cached ETag.
+    """
+    parts = urlsplit(uri)
+    query = []
+    for k, v in parse_qsl(parts.query, keep_blank_values=True):
+        if k in UNREPEATABLE_QUERY_PARAMS:
+            return None
+        if k in DAY_NORMALIZED_QUERY_PARAMS:
+            v = v[:10]
+        query.append((k, v))
+    return urlunsplit(parts._replace(query=urlencode(sorted(query))))
+
+
+def endpoint_name(uri):
+    # E.g., /drive/v3/files/<file ID> => /drive/v3/files/{id}; Google API paths alternate collections and IDs
+    segments = urlsplit(uri).path.strip("/").split("/")
+    return "/" + "/".join(
+        "{id}" if i >= 3 and (i - 3) % 2 == 0 else s for i, s in enumerate(segments)
+    )
+
+
+def record_request(uri, hit, bytes_saved=0):
+    with _stats_lock:
+        stats = _stats.setdefault(
+            endpoint_name(uri), dict(requests=0, hits=0, bytes_saved=0)
+        )
+        stats["requests"] += 1
+        stats["hits"] += int(hit)
+        stats["bytes_saved"] += bytes_saved
+
+
+def get_http_cache_stats():
+    with _stats_lock:
+        return {
+            endpoint: dict(stats, hit_ratio=round(stats["hits"] / stats["requests"], 3))
+            for endpoint, stats in _stats.items()
+        }
+
+
+def parse_mime(content_type, text):
+    # Prepend the content-type header (as googleapiclient does) so FeedParser can split the multipart body
+    parser = FeedParser()
+    parser.feed(f"content-type: {content_type}\r\n\r\n")
+    parser.feed(text)
+    return parser.close()
+
+
+def parse_http_part(payload):
+    """Split a batch part's application/http payload into (status line, lower-cased headers, body)."""
+    status_line, message = payload.split("\n", 1)
+    parser = FeedParser()
+    parser.feed(message)
+    headers = {k.lower(): v for k, v in parser.close().items()}
+    body = message.split("\r\n\r\n", 1)[1] if "\r\n\r\n" in message else ""
+    return status_line.strip(), headers, body
+
+
+class ConditionalHttp(object):
+    """Wraps an (authorized) httplib2.Http, revalidating cached GET responses with If-None-Match."""
+
+    def __init__(self, http, cache_dir=None, max_bytes=None) -> None:
+        self._http = http
+        self.cache_dir = cache_dir or get_http_cache_dir()
+        if max_bytes is None:
+            max_bytes = get_http_cache_max_bytes()
+        self.max_bytes = max_bytes
+
+    def cache_path(self, key):
+        return os.path.join(
+            self.cache_dir, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+        )
+
+    def load_entry(self, key):
+        cache_path = self.cache_path(key)
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as err:
+            logger.warning(f"Ignoring unreadable HTTP cache entry for {key=}: {err=}")
+            return None
+
+    def touch_entry(self, key):
+        # Bumps the entry's mtime, which prune() treats as its last use
+        try:
+            os.utime(self.cache_path(key))
+        except FileNotFoundError:
+            pass
+
+    def save_entry(self, key, headers, content):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.cache_dir, delete=False, encoding="utf-8"
+        ) as f:
+            json.dump(
+                dict(
+                    etag=headers["etag"],
+                    headers={
+                        k: v for k, v in headers.items() if k not in UNREPLAYED_HEADERS
+                    },
+                    body_b64=base64.b64encode(content or b"").decode("ascii"),
+                ),
+                f,
+            )
+        os.replace(f.name, self.cache_path(key))
+        self.prune()
+
+    def prune(self):
+        # Least recently used first
+        cached_paths = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, filename))
+            except FileNotFoundError:
+                continue
+            cached_paths.append((stat.st_mtime, stat.st_size, filename))
+        total_bytes = sum(size for _, size, _ in cached_paths)
+        for _, size, filename in sorted(cached_paths):
+            if total_bytes <= self.max_bytes:
+                break
+            logger.debug(f"Pruning {filename=} from HTTP cache ({size=})")
+            try:
+                os.remove(os.path.join(self.cache_dir, filename))
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        headers = dict(headers or {})
+        if method == "POST" and urlsplit(uri).path.startswith(BATCH_PATH_PREFIX):
+            return self.batch_request(uri, body=body, headers=headers, **kwargs)
+
+        # Ranged (media download) requests are left to the image cache
+        key = cache_key(uri)
+        if method != "GET" or key is None or any(k.lower() == "range" for k in headers):
+            return self._http.request(
+                uri, method=method, body=body, headers=headers, **kwargs
+            )
+
+        entry = self.load_entry(key)
+        if entry is not None:
+            headers["If-None-Match"] = entry["etag"]
+        resp, content = self._http.request(
+            uri, method=method, body=body, headers=headers, **kwargs
+        )
+
+        if resp.status == 304 and entry is not None:
+            content = base64.b64decode(entry["body_b64"])
+            self.touch_entry(key)
+            logger.debug(f"HTTP cache hit (304 Not Modified) for {uri=}")
+            record_request(uri, hit=True, bytes_saved=len(content))
+            return httplib2.Response(dict(entry["headers"], status=200)), content
+
+        record_request(uri, hit=False)
+        if resp.status == 200 and "etag" in resp:
+            self.save_entry(key, resp, content)
+        return resp, content
+
+    def batch_request(self, uri, body, headers, **kwargs):
+        """Send a googleapiclient batch request, revalidating each of its GET parts like a standalone GET."""
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        content_type = {k.lower(): v for k, v in headers.items()}.get("content-type")
+        request_message = parse_mime(content_type, body)
+        if not request_message.is_multipart():
+            return self._http.request(
+                uri, method="POST", body=body, headers=headers, **kwargs
+            )
+
+        cached_parts = {}
+        for part in request_message.get_payload():
+            status_line, part_headers, _ = parse_http_part(part.get_payload())
+            part_method, path, _ = status_line.split(" ", 2)
+            part_uri = f"https://{part_headers.get('host', urlsplit(uri).netloc)}{path}"
+            key = cache_key(part_uri)
+            if part_method != "GET" or key is None:
+                continue
+            entry = self.load_entry(key)
+            cached_parts[part["Content-ID"]] = (part_uri, key, entry)
+            if entry is not None:
+                body = body.replace(
+                    f"{status_line}\n",
+                    f"{status_line}\nIf-None-Match: {entry['etag']}\n",
+                    1,
+                )
+
+        resp, content = self._http.request(
+            uri, method="POST", body=body, headers=headers, **kwargs
+        )
+        if resp.status != 200 or not cached_parts:
+            return resp, content
+        response_message = parse_mime(resp["content-type"], content.decode("utf-8"))
+        if not response_message.is_multipart():
+            return resp, content
+
+        response_parts = []
+        for part in response_message.get_payload():
+            content_id, payload = part["Content-ID"], part.get_payload()
+            # Response parts echo their request's Content-ID as <response-...>
+            request_content_id = content_id.replace("<response-", "<", 1)
+            if request_content_id not in cached_parts:
+                response_parts.append((content_id, payload))
+                continue
+            part_uri, key, entry = cached_parts[request_content_id]
+            status_line, part_headers, part_body = parse_http_part(payload)
+            status = int(status_line.split(" ", 2)[1])
+            if status == 304 and entry is not None:
+                cached_body = base64.b64decode(entry["body_b64"])
+                self.touch_entry(key)
+                logger.debug(f"HTTP cache hit (304 Not Modified) for {part_uri=}")
+                record_request(part_uri, hit=True, bytes_saved=len(cached_body))
+                payload = "".join(
+                    ["HTTP/1.1 200 OK\r\n"]
+                    + [f"{k}: {v}\r\n" for k, v in entry["headers"].items()]
+                    + ["\r\n", cached_body.decode("utf-8")]
+                )
+            else:
+                record_request(part_uri, hit=False)
+                if status == 200 and "etag" in part_headers:
+                    self.save_entry(key, part_headers, part_body.encode("utf-8"))
+            response_parts.append((content_id, payload))
+
+        # Reassemble the multipart response (googleapiclient only needs each part's Content-ID and payload)
+        boundary = f"batch_{uuid.uuid4().hex}"
+        content = "".join(
+            f"--{boundary}\r\nContent-Type: application/http\r\n"
+            f"Content-ID: {content_id}\r\n\r\n{payload}\r\n"
+            for content_id, payload in response_parts
+        )
+        content += f"--{boundary}--\r\n"
+        response_headers = {
+            k: v for k, v in resp.items() if k not in UNREPLAYED_HEADERS
+        }
+        response_headers["content-type"] = f"multipart/mixed; boundary={boundary}"
+        return (
+            httplib2.Response(dict(response_headers, status=resp.status)),
+            content.encode("utf-8"),
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._http, name)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from config import cfg
+from logzero import logger
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+IMAGE_CACHE_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", ".image_cache"))
+STATIC_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", "static"))
+MANIFEST_FILENAME = "manifest.json"
+
+
+class ImageCache(object):
+    """Content-addressed store for Drive images, keyed by each file's md5Checksum (or modifiedTime).
+
+    The manifest tracks cached entries (for LRU eviction under a size cap) and which images were copied
+    into static/ by the last build, so changed images are refreshed and unused ones are removed from the
+    build output.
+    """
+
+    def __init__(
+        self, cache_dir=IMAGE_CACHE_DIR, static_dir=STATIC_DIR, max_bytes=None
+    ):
+        self.cache_dir = cache_dir
+        self.static_dir = static_dir
+        if max_bytes is None:
+            max_bytes = int(cfg.image_cache_max_bytes)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        manifest = self.load_manifest()
+        self.entries = manifest.get("entries", {})
+        self.published = manifest.get("published", {})
+        self.referenced_keys = set()
+        self.referenced_filenames = set()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.cache_dir, MANIFEST_FILENAME)
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return dict()
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as err:
+            logger.warning(
+                f"Unable to read image cache manifest, starting fresh: {err=}"
+            )
+            return dict()
+
+    def save_manifest(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.cache_dir, delete=False, encoding="utf-8"
+        ) as f:
+            json.dump(dict(entries=self.entries, published=self.published), f)
+        os.replace(f.name, self.manifest_path)
+
+    @staticmethod
+    def cache_key(image_file):
+        if md5_checksum := image_file.get("md5Checksum"):
+            return md5_checksum
+        # Not all Drive files carry a checksum; fall back to a version-specific key
+        version = f"{image_file['id']}:{image_file.get('modifiedTime', '')}"
+        return hashlib.md5(version.encode("utf-8")).hexdigest()
+
+    def cache_path(self, key, mime_type):
+        return os.path.join(
+            self.cache_dir, f"{key}{mimetypes.guess_extension(mime_type)}"
+        )
+
+    def ensure_local(self, image_file, download):
+        """Place the current content of image_file at its local_path, calling download() only on a cache miss."""
+        key = self.cache_key(image_file)
+        cache_path = self.cache_path(key, image_file["mimeType"])
+        local_path = image_file["local_path"]
+        static_filename = os.path.basename(local_path)
+
+        with self._lock:
+            self.referenced_keys.add(key)
+            self.referenced_filenames.add(static_filename)
+            cached = key in self.entries and os.path.exists(cache_path)
+        if not cached:
+            logger.debug(
+                f"Image cache miss for {image_file['name']} ({key=}), downloading..."
+            )
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.cache_dir, delete=False) as f:
+                f.write(download())
+            os.replace(f.name, cache_path)
+
+        with self._lock:
+            self.entries[key] = dict(
+                filename=os.path.basename(cache_path),
+                file_id=image_file["id"],
+                modified_time=image_file.get("modifiedTime"),
+                size=os.path.getsize(cache_path),
+                last_used=time.time(),
+            )
+            up_to_date = self.published.get(static_filename) == key
+        if up_to_date and os.path.exists(local_path):
+            logger.debug(f"{image_file['name']} unchanged on disk ({local_path=})")
+            return image_file
+
+        logger.debug(f"Copying {image_file['name']} ({key=}) into {local_path=}")
+        shutil.copyfile(cache_path, local_path)
+        with self._lock:
+            self.published[static_filename] = key
+        return image_file
+
+    def finalize(self):
+        """Drop images no longer used by this build from static/ and evict cache entries beyond the size cap.
+
+        An image counts as used if ensure_local() was asked for it during this build (even if its download
+        failed), as static/ filenames are derived from Drive file IDs rather than (non-unique) file names.
+        """
+        for static_filename in list(self.published):
+            if static_filename in self.referenced_filenames:
+                continue
+            logger.info(
+                f"Removing no-longer-referenced image from static/: {static_filename}"
+            )
+            static_path = os.path.join(self.static_dir, static_filename)
+            if os.path.exists(static_path):
+                os.remove(static_path)
+            del self.published[static_filename]
+
+        total_bytes = sum(e["size"] for e in self.entries.values())
+        evictable = sorted(
+            (k for k in self.entries if k not in self.referenced_keys),
+            key=lambda k: self.entries[k]["last_used"],
+        )
+        for key in evictable:
+            if total_bytes <= self.max_bytes:
+                break
+            entry = self.entries.pop(key)
+            logger.info(
+                f"Evicting {entry['filename']} from image cache ({entry['size']=})"
+            )
+            cache_path = os.path.join(self.cache_dir, entry["filename"])
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            total_bytes -= entry["size"]
+        logger.debug(
+            f"Image cache size after eviction: {total_bytes=} ({self.max_bytes=})"
+        )
+        self.save_manifest()
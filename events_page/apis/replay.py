@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""Record / replay transport for offline (and reproducible) runs against Google APIs.
+
+Set EVENTS_PAGE_HTTP_REPLAY_MODE to "record" to capture live responses into the fixtures directory
+(EVENTS_PAGE_HTTP_FIXTURES_DIR) or "replay" to serve them back without touching the network.
+EVENTS_PAGE_HTTP_REPLAY_LATENCY_MS optionally injects a fixed delay per replayed response.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import httplib2
+from logzero import logger
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_FIXTURES_DIR = os.path.abspath(os.path.join(BASE_DIR, "..", ".http_fixtures"))
+
+RECORD_MODE = "record"
+REPLAY_MODE = "replay"
+
+# The events window is derived from the current time, so these would never match between runs
+IGNORED_QUERY_PARAMS = {"timeMin", "timeMax"}
+KEYED_HEADERS = {"range"}
+# Batch requests use a random multipart boundary and a random UUID within each part's Content-ID
+BOUNDARY_REGEXP = re.compile(r'boundary="?(?P<boundary>[^";]+)"?')
+UUID_REGEXP = re.compile(
+    rb"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+)
+
+
+class MissingFixtureException(Exception):
+    pass
+
+
+def get_replay_mode():
+    return os.getenv("EVENTS_PAGE_HTTP_REPLAY_MODE", "").lower() or None
+
+
+def get_fixtures_dir():
+    return os.getenv("EVENTS_PAGE_HTTP_FIXTURES_DIR", DEFAULT_FIXTURES_DIR)
+
+
+def get_replay_latency_secs():
+    return float(os.getenv("EVENTS_PAGE_HTTP_REPLAY_LATENCY_MS", 0)) / 1000
+
+
+def normalize_uri(uri):
+    parts = urlsplit(uri)
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in IGNORED_QUERY_PARAMS
+    )
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def normalize_body(body, headers):
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    content_type = {k.lower(): v for k, v in (headers or {}).items()}.get(
+        "content-type", ""
+    )
+    if body and content_type.startswith("multipart/"):
+        if boundary_match := BOUNDARY_REGEXP.search(content_type):
+            body = body.replace(boundary_match.group("boundary").encode("utf-8"), b"")
+        body = UUID_REGEXP.sub(b"", body)
+    return body
+
+
+def fixture_key(method, uri, body=None, headers=None):
+    key_headers = {
+        k.lower(): v for k, v in (headers or {}).items() if k.lower() in KEYED_HEADERS
+    }
+    body = normalize_body(body, headers)
+    digest = hashlib.sha256()
+    digest.update(method.upper().encode("utf-8"))
+    digest.update(normalize_uri(uri).encode("utf-8"))
+    digest.update(json.dumps(key_headers, sort_keys=True).encode("utf-8"))
+    digest.update(body or b"")
+    return digest.hexdigest()
+
+
+def fixture_path(fixtures_dir, key):
+    return os.path.join(fixtures_dir, f"{key}.json")
+
+
+def write_fixture(fixtures_dir, key, fixture):
+    os.makedirs(fixtures_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        "w", dir=fixtures_dir, delete=False, encoding="utf-8"
+    ) as f:
+        json.dump(fixture, f, indent=2, sort_keys=True)
+    os.replace(f.name, fixture_path(fixtures_dir, key))
+
+
+def read_fixture(fixtures_dir, key, description):
+    path = fixture_path(fixtures_dir, key)
+    if not os.path.exists(path):
+        raise MissingFixtureException(
+            f"No recorded fixture for {description} (expected at {path})"
+        )
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class RecordingHttp(object):
+    """Wraps an (authorized) httplib2.Http, saving every response to the fixtures directory."""
+
+    def __init__(self, http, fixtures_dir=None) -> None:
+        self._http = http
+        self.fixtures_dir = fixtures_dir or get_fixtures_dir()
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        resp, content = self._http.request(
+            uri, method=method, body=body, headers=headers, **kwargs
+        )
+        key = fixture_key(method, uri, body, headers)
+        logger.debug(f"Recording {method} {uri} => {resp.status} as fixture {key}")
+        write_fixture(
+            self.fixtures_dir,
+            key,
+            dict(
+                method=method,
+                uri=normalize_uri(uri),
+                status=resp.status,
+                headers={k: v for k, v in resp.items() if k != "status"},
+                body_b64=base64.b64encode(content or b"").decode("ascii"),
+            ),
+        )
+        return resp, content
+
+    def __getattr__(self, name):
+        return getattr(self._http, name)
+
+
+class ReplayHttp(object):
+    """httplib2.Http stand-in serving responses previously captured by RecordingHttp."""
+
+    credentials = None
+
+    def __init__(self, fixtures_dir=None, latency_secs=None) -> None:
+        self.fixtures_dir = fixtures_dir or get_fixtures_dir()
+        if latency_secs is None:
+            latency_secs = get_replay_latency_secs()
+        self.latency_secs = latency_secs
+        self.timeout = None
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        key = fixture_key(method, uri, body, headers)
+        fixture = read_fixture(self.fixtures_dir, key, f"{method} {uri}")
+        if self.latency_secs:
+            time.sleep(self.latency_secs)
+        resp = httplib2.Response(dict(fixture["headers"], status=fixture["status"]))
+        return resp, base64.b64decode(fixture["body_b64"])
+
+    def close(self):
+        pass
+
+
+def secret_fixture_key(secret_name):
+    # Key on the secret ID alone as the project is unknown without credentials in replay mode
+    secret_id = secret_name.split("/secrets/", 1)[-1].split("/", 1)[0]
+    return f"secret-{secret_id}"
+
+
+def record_secret_payload(secret_name, payload):
+    write_fixture(
+        get_fixtures_dir(),
+        secret_fixture_key(secret_name),
+        dict(secret_name=secret_name, payload=payload),
+    )
+
+
+def replay_secret_payload(secret_name):
+    fixture = read_fixture(
+        get_fixtures_dir(), secret_fixture_key(secret_name), f"secret {secret_name}"
+    )
+    if get_replay_latency_secs():
+        time.sleep(get_replay_latency_secs())
+    return fixture["payload"]
@@ -1,31 +1,59 @@
 #!/usr/bin/env python
 import json
+import os
+import time
 
-import google.auth
 from google.cloud.secretmanager import SecretManagerServiceClient
 from logzero import logger
 from google.api_core.exceptions import PermissionDenied
-from apis import Singleton
+from apis import Singleton, load_credentials, load_default_credentials, replay
+
+# Read directly from the environment as (the rest of) our config is itself loaded from these secrets
+DEFAULT_SECRETS_TTL_SECS = 300
 
 
 class Secrets(metaclass=Singleton):
     _secrets = None
+    _secrets_loaded_at = None
+    _client = None
+    _credentials = None
 
     def __init__(self, credentials=None) -> None:
-        default_credentials, project = google.auth.default()
+        # Singleton re-runs __init__ on every Secrets() call; keep the existing client (and cached payload) unless
+        # different credentials are requested
+        if self._client is not None and credentials in (None, self._credentials):
+            return
+
+        self.replay_mode = replay.get_replay_mode()
+        if self.replay_mode == replay.REPLAY_MODE:
+            self.secret_name = "projects/-/secrets/events-page/versions/latest"
+            self._client = None
+            return
+
+        _, project = load_default_credentials()
         logger.debug(f"Default credentials project: {project}")
         self.secret_name = f"projects/{project}/secrets/events-page/versions/latest"
         logger.debug(f"Secret name: {self.secret_name=}")
         if credentials is None:
-            credentials = default_credentials
+            # The same (cached) credentials cfg.load() passes in, so neither caller forces a new client
+            credentials = load_credentials()
+        self._credentials = credentials
         self._client = SecretManagerServiceClient(credentials=credentials)
+        self._secrets = None
 
     @property
     def secrets(self):
-        if self._secrets is not None:
+        ttl_secs = float(
+            os.getenv("EVENTS_PAGE_SECRETS_TTL_SECS", DEFAULT_SECRETS_TTL_SECS)
+        )
+        if (
+            self._secrets is not None
+            and time.monotonic() - self._secrets_loaded_at < ttl_secs
+        ):
             return self._secrets
 
         self._secrets = self.read_secret_version(secret_name=self.secret_name)
+        self._secrets_loaded_at = time.monotonic()
         logger.debug(f"{self._secrets.keys()=}")
         return self._secrets
 
@@ -33,12 +61,17 @@ class Secrets(metaclass=Singleton):
         return self.secrets.get(key)
 
     def read_secret_version(self, secret_name):
+        if self.replay_mode == replay.REPLAY_MODE:
+            return json.loads(replay.replay_secret_payload(secret_name))
+
         try:
             response = self._client.access_secret_version(request={"name": secret_name})
         except PermissionDenied as err:
             logger.warning(f"Unable to read secret at {secret_name=}!: {err=}")
             return dict()
         payload = response.payload.data.decode("UTF-8")
+        if self.replay_mode == replay.RECORD_MODE:
+            replay.record_secret_payload(secret_name, payload)
         return json.loads(payload)
 
 
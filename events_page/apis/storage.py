@@ -1,54 +1,338 @@
 #!/usr/bin/env python
-from google.cloud import storage
-import glob
+import base64
+import hashlib
+import mimetypes
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import google_crc32c
+import requests
+from config import cfg
+from google.api_core import exceptions
+from google.cloud import storage
 from logzero import logger
+from tenacity import retry
+from tenacity.retry import retry_if_exception_type
+from tenacity.stop import stop_after_attempt
+from tenacity.wait import wait_exponential
 
-from apis import load_credentials
+from apis import load_credentials, load_default_credentials
 
 BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+# GCS JSON API batch requests are limited to 100 calls each
+MAX_BATCH_SIZE = 100
+BUILD_FINGERPRINT_METADATA_KEY = "build-fingerprint"
+DEFAULT_CACHE_CONTROL = "no-cache"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Static assets renamed by fingerprint.fingerprint_build(); e.g., static/style.0123456789ab.css
+FINGERPRINTED_PATH_REGEXP = re.compile(r"(^|/)static/.+\.[0-9a-f]{12}\.[^./]+$")
+TRANSIENT_ERRORS = (
+    exceptions.TooManyRequests,
+    exceptions.InternalServerError,
+    exceptions.BadGateway,
+    exceptions.ServiceUnavailable,
+    exceptions.GatewayTimeout,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
 
+retry_transient_errors = retry(
+    retry=retry_if_exception_type(TRANSIENT_ERRORS),
+    before_sleep=lambda r: logger.warning(
+        f"Transient error from GCS ({r.outcome.exception()}), retrying... Attempt number: {r.attempt_number}"
+    ),
+    wait=wait_exponential(multiplier=0.5, max=10),
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
 
-def get_client(credentials=None):
+
+def get_client(credentials=None, max_workers=None):
+    if credentials is None:
+        credentials = load_credentials()
+    if max_workers is None:
+        max_workers = int(cfg.gcs_transfer_workers)
     if credentials is None:
-        credentials = load_credentials(credentials)
-    return storage.Client()
+        client = storage.Client()
+    else:
+        _, project = load_default_credentials()
+        client = storage.Client(project=project, credentials=credentials)
+    # Size the shared (keep-alive) connection pool to match the number of concurrent transfers
+    client._http.mount(
+        "https://",
+        requests.adapters.HTTPAdapter(
+            pool_connections=max_workers, pool_maxsize=max_workers
+        ),
+    )
+    return client
 
 
-def upload_build_to_gcs(client, bucket_id, prefix):
+def upload_build_to_gcs(client, bucket_id, prefix, precompressed_files=None):
     if prefix is None:
         prefix = ""
     bucket = client.get_bucket(bucket_id)
     build_dir_path = os.path.abspath(os.path.join(BASE_DIR, "..", "build/"))
     logger.info(f"Uploading {build_dir_path=} to {bucket=} ({prefix=})")
-    upload_local_directory_to_gcs(client, build_dir_path, bucket, prefix)
+    if cfg.gcs_publish_mode == "sync":
+        publish_stats = sync_local_directory_to_gcs(
+            client,
+            build_dir_path,
+            bucket,
+            prefix,
+            preserved_prefixes=get_preserved_prefixes(prefix),
+            precompressed_files=precompressed_files,
+        )
+    else:
+        upload_local_directory_to_gcs(
+            client, build_dir_path, bucket, prefix, precompressed_files
+        )
+        publish_stats = None
     logger.info(f"{build_dir_path=} upload to {bucket=} ({prefix=}) completed!")
+    return publish_stats
+
+
+def get_index_blob_name(prefix):
+    return os.path.join(prefix or "", "index.html")
+
+
+def get_published_build_fingerprint(client, bucket_id, prefix):
+    blob = client.bucket(bucket_id).get_blob(get_index_blob_name(prefix))
+    if blob is None:
+        return None
+    return (blob.metadata or {}).get(BUILD_FINGERPRINT_METADATA_KEY)
+
+
+@retry_transient_errors
+def set_published_build_fingerprint(client, bucket_id, prefix, build_fingerprint):
+    blob = client.bucket(bucket_id).blob(get_index_blob_name(prefix))
+    blob.metadata = {BUILD_FINGERPRINT_METADATA_KEY: build_fingerprint}
+    logger.debug(f"Recording {build_fingerprint=} on gs://{bucket_id}/{blob.name}")
+    blob.patch()
+    return blob
+
+
+def get_preserved_prefixes(prefix):
+    if prefix:
+        return []
+    # Publishing at the bucket root must leave test site prefixes (e.g., tests/pr-123/) alone
+    return [p.strip() for p in cfg.gcs_sync_preserved_prefixes.split(",") if p.strip()]
 
 
 def remove_subpath_from_gcs(client, bucket_id, prefix):
     bucket = client.get_bucket(bucket_id)
-    blobs_to_delete = bucket.list_blobs(prefix=prefix)
-    for blob in blobs_to_delete:
-        blob.delete()
-    # bucket.delete_blobs(blobs_to_delete)
-    # logger.info(f"{len(list(blobs_to_delete))=} deleted from gs://{bucket_id}/{prefix}")
-    logger.info(f"All blobs deleted from gs://{bucket_id}/{prefix}")
+    blobs_to_delete = list(list_remote_blobs(bucket, prefix).values())
+    delete_blobs(client, blobs_to_delete)
+    logger.info(f"{len(blobs_to_delete)=} deleted from gs://{bucket_id}/{prefix}")
 
 
-def upload_local_directory_to_gcs(client, local_path, bucket, gcs_path):
+def upload_local_directory_to_gcs(
+    client, local_path, bucket, gcs_path, precompressed_files=None
+):
     assert os.path.isdir(local_path)
-    for local_file in glob.glob(local_path + "/**"):
-        if not os.path.isfile(local_file):
-            upload_local_directory_to_gcs(
-                client,
-                local_file,
-                bucket,
-                os.path.join(gcs_path, os.path.basename(local_file)),
+    upload_files(
+        bucket,
+        list_local_files(local_path, gcs_path),
+        precompressed_files=precompressed_files,
+    )
+
+
+@retry_transient_errors
+def upload_file(bucket, remote_path, local_file, cache_control, compressed_file=None):
+    blob = bucket.blob(remote_path)
+    blob.cache_control = cache_control
+    if compressed_file is None:
+        logger.debug(f"Uploading {local_file=}) to {remote_path=}")
+        blob.upload_from_filename(local_file)
+        return blob
+    # GCS serves gzip-encoded objects as-is to clients accepting gzip and decompresses them for the rest
+    blob.content_encoding = "gzip"
+    logger.debug(f"Uploading {compressed_file=} (for {local_file=}) to {remote_path=}")
+    blob.upload_from_filename(
+        compressed_file, content_type=mimetypes.guess_type(local_file)[0]
+    )
+    return blob
+
+
+def get_cache_control(remote_path):
+    if FINGERPRINTED_PATH_REGEXP.search(remote_path):
+        return IMMUTABLE_CACHE_CONTROL
+    return DEFAULT_CACHE_CONTROL
+
+
+def upload_files(bucket, files_to_upload, precompressed_files=None, max_workers=None):
+    if precompressed_files is None:
+        precompressed_files = {}
+    if max_workers is None:
+        max_workers = int(cfg.gcs_transfer_workers)
+    # Fingerprinted assets go first so no published page ever references one that is not there (yet)
+    upload_phases = [
+        {
+            remote_path: local_file
+            for remote_path, local_file in files_to_upload.items()
+            if (get_cache_control(remote_path) == IMMUTABLE_CACHE_CONTROL) == immutable
+        }
+        for immutable in (True, False)
+    ]
+    blobs = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for phase_files in upload_phases:
+            futures = [
+                executor.submit(
+                    upload_file,
+                    bucket,
+                    remote_path,
+                    local_file,
+                    get_cache_control(remote_path),
+                    precompressed_files.get(local_file),
+                )
+                for remote_path, local_file in phase_files.items()
+            ]
+            # Surface the first failed upload (if any) once all of this phase's transfers have been attempted
+            blobs += [f.result() for f in futures]
+    return blobs
+
+
+@retry_transient_errors
+def delete_blob(blob):
+    try:
+        blob.delete()
+    except exceptions.NotFound:
+        logger.debug(f"{blob.name=} already deleted")
+
+
+def delete_blobs(client, blobs):
+    for batch_start in range(0, len(blobs), MAX_BATCH_SIZE):
+        batch_blobs = blobs[batch_start : batch_start + MAX_BATCH_SIZE]  # noqa
+        logger.debug(f"Deleting {len(batch_blobs)} blobs in a batch")
+        try:
+            with client.batch():
+                for blob in batch_blobs:
+                    blob.delete()
+        except exceptions.GoogleAPICallError as err:
+            # Batches report only the first failure; retry each of this batch's deletions individually instead
+            logger.warning(
+                f"Batch deletion failed ({err}), deleting blobs one by one..."
             )
-        else:
-            remote_path = os.path.join(gcs_path, os.path.basename(local_file))
-            blob = bucket.blob(remote_path)
-            blob.cache_control = "no-cache"
-            logger.debug(f"Uploading {local_file=}) to {remote_path=}")
-            # logger.debug(f"Uploading {blob=} ({local_file=}) to: {bucket=}")
-            blob.upload_from_filename(local_file)
+            for blob in batch_blobs:
+                delete_blob(blob)
+
+
+def list_local_files(local_path, gcs_path):
+    local_files = {}
+    for dirpath, dirnames, filenames in os.walk(local_path):
+        # Hidden files and directories (e.g., .DS_Store) are never published
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for filename in filenames:
+            if filename.startswith("."):
+                continue
+            local_file = os.path.join(dirpath, filename)
+            relative_path = os.path.relpath(local_file, local_path)
+            local_files[os.path.join(gcs_path, relative_path)] = local_file
+    return local_files
+
+
+def list_remote_blobs(bucket, gcs_path):
+    # Trailing slash keeps e.g. tests/pr-1 from also matching tests/pr-10
+    list_prefix = f"{gcs_path.rstrip('/')}/" if gcs_path else None
+    return {b.name: b for b in bucket.list_blobs(prefix=list_prefix)}
+
+
+def local_file_md5(local_file):
+    md5 = hashlib.md5()
+    with open(local_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(chunk)
+    return base64.b64encode(md5.digest()).decode("ascii")
+
+
+def local_file_crc32c(local_file):
+    crc32c = google_crc32c.Checksum()
+    with open(local_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            crc32c.update(chunk)
+    return base64.b64encode(crc32c.digest()).decode("ascii")
+
+
+def blob_matches_local_file(blob, local_file, cache_control, compressed_file=None):
+    if blob.cache_control != cache_control:
+        return False
+    if blob.content_encoding != ("gzip" if compressed_file else None):
+        return False
+    if compressed_file is not None:
+        local_file = compressed_file
+    if blob.size != os.path.getsize(local_file):
+        return False
+    if blob.md5_hash:
+        return blob.md5_hash == local_file_md5(local_file)
+    # Composite objects carry no MD5 hash, only CRC32C
+    return blob.crc32c == local_file_crc32c(local_file)
+
+
+def sync_local_directory_to_gcs(
+    client,
+    local_path,
+    bucket,
+    gcs_path,
+    preserved_prefixes=None,
+    precompressed_files=None,
+):
+    """Upload only new or changed files and delete remote objects no longer present locally."""
+    assert os.path.isdir(local_path)
+    if preserved_prefixes is None:
+        preserved_prefixes = []
+    if precompressed_files is None:
+        precompressed_files = {}
+
+    local_files = list_local_files(local_path, gcs_path)
+    remote_blobs = list_remote_blobs(bucket, gcs_path)
+    logger.debug(f"sync: {len(local_files)=} vs. {len(remote_blobs)=}")
+
+    publish_stats = dict(
+        uploaded_files={},
+        uploaded_paths=[],
+        uploaded_bytes=0,
+        deleted_paths=[],
+        unchanged_objects=0,
+    )
+    files_to_upload = {}
+    for remote_path, local_file in sorted(local_files.items()):
+        blob = remote_blobs.get(remote_path)
+        if blob is not None and blob_matches_local_file(
+            blob,
+            local_file,
+            get_cache_control(remote_path),
+            precompressed_files.get(local_file),
+        ):
+            publish_stats["unchanged_objects"] += 1
+            continue
+        files_to_upload[remote_path] = local_file
+    upload_files(bucket, files_to_upload, precompressed_files)
+    # Record what was actually transferred (i.e., the gzipped variant where there is one)
+    publish_stats["uploaded_files"] = {
+        remote_path: precompressed_files.get(local_file, local_file)
+        for remote_path, local_file in files_to_upload.items()
+    }
+    publish_stats["uploaded_paths"] = list(files_to_upload)
+    publish_stats["uploaded_bytes"] = sum(
+        os.path.getsize(f) for f in publish_stats["uploaded_files"].values()
+    )
+
+    blobs_to_delete = []
+    for remote_path, blob in sorted(remote_blobs.items()):
+        if remote_path in local_files:
+            continue
+        relative_path = os.path.relpath(remote_path, gcs_path or ".")
+        if any(relative_path.startswith(p) for p in preserved_prefixes):
+            continue
+        logger.debug(f"Deleting extraneous {remote_path=}")
+        blobs_to_delete.append(blob)
+    delete_blobs(client, blobs_to_delete)
+    publish_stats["deleted_paths"] = [b.name for b in blobs_to_delete]
+
+    logger.info(
+        f"sync_local_directory_to_gcs() => uploaded {len(publish_stats['uploaded_paths'])} objects "
+        f"({publish_stats['uploaded_bytes']} bytes), deleted {len(publish_stats['deleted_paths'])} objects, "
+        f"{publish_stats['unchanged_objects']} unchanged"
+    )
+    return publish_stats
@@ -1,4 +1,5 @@
 #!/usr/bin/env python
+import uuid
 from zoneinfo import ZoneInfo
 
 import flask
@@ -32,12 +33,17 @@ assets.register(bundles)
 
 @app.route("/")
 def events():
-    return flask.render_template(
-        "index.html",
-        calendar=gcal.load_calendar(
+    if build_context := app.config.get("BUILD_CONTEXT"):
+        calendar = build_context.calendar
+    else:
+        # Local dev server runs without a prepared build context; fetch events per request
+        calendar = gcal.load_calendar(
             service=gcal.build_service(),
             calendar_id=cfg.calendar_id,
-        ),
+        )
+    return flask.render_template(
+        "index.html",
+        calendar=calendar,
     )
 
 
@@ -74,9 +80,7 @@ def get_base_url():
     return f"https://{cfg.hostname}"
 
 
-def create_app():
-    cfg.load()
-
+def configure_app(build_context=None, **config_overrides):
     # TODO: do this default settings thing better?
     default_app_config = dict(
         display_timezone=cfg.display_timezone,
@@ -84,12 +88,21 @@ def create_app():
         FREEZER_STATIC_IGNORE=["*.scss", ".webassets-cache/*", ".DS_Store"],
         FREEZER_RELATIVE_URLS=False,
         FREEZER_REMOVE_EXTRA_FILES=True,
+        BUILD_CONTEXT=build_context,
+        # Embedded in rendered pages so publication can confirm when the edge serves this build
+        BUILD_ID=uuid.uuid4().hex,
     )
-    logger.info(f"create_app() => {default_app_config=}")
+    default_app_config.update(config_overrides)
+    logger.info(f"configure_app() => {default_app_config=}")
     app.config.update(default_app_config)
     return app
 
 
+def create_app(build_context=None):
+    cfg.load()
+    return configure_app(build_context=build_context)
+
+
 if __name__ == "__main__":
     app = create_app()
     app.run(
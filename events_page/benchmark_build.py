@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+import json
+import multiprocessing
+import random
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from textwrap import dedent
+
+from logzero import logger
+
+from apis.calendar import Calendar
+from apis.constants import CalendarColors
+from apis.mls import TeamColors
+from build_context import BuildContext
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_TIERS = "100,1000,10000,50000"
+DEFAULT_IMAGE_SHARE = 0.25
+DEFAULT_MATCH_SHARE = 0.1
+DEFAULT_NUM_CATEGORIES = 4
+DEFAULT_MAX_REGRESSION_PCT = 20
+DEFAULT_SEED = 1312
+REGRESSION_METRICS = ["wall_time_secs", "peak_rss_kb"]
+
+
+def generate_event_categories(num_categories):
+    color_names = [n for n in CalendarColors._event_colors if n != "unset"]
+    event_categories = {}
+    for index, color_name in enumerate(color_names[:num_categories]):
+        event_categories[f"category-{index}"] = dict(
+            gcal_color_name=color_name,
+            gcal_color=CalendarColors().get(color_name),
+            bg_color="#2e7d32",
+            text_fg_color="#ffffff",
+            text_bg_color="#000000",
+            always_shown_in_filters=index % 2 == 0,
+            default_cover_image="linear-gradient(#00b140, #000000)",
+        )
+    return event_categories
+
+
+def generate_raw_events(num_events, image_share, match_share, event_categories, seed):
+    rng = random.Random(seed)
+    color_ids = [c["gcal_color"]["id"] for c in event_categories.values()] + ["0"]
+    team_names = [t["name"] for t in TeamColors._team_colors.values()]
+    first_start = datetime.utcnow().replace(microsecond=0) + timedelta(hours=1)
+    for index in range(num_events):
+        start = first_start + timedelta(minutes=30 * index)
+        raw_event = dict(
+            id=f"benchmark{index:08d}",
+            status="confirmed",
+            htmlLink=f"https://www.google.com/calendar/event?eid=benchmark{index:08d}",
+            summary=f"Synthetic event #{index}",
+            colorId=rng.choice(color_ids),
+            start=dict(dateTime=start.isoformat() + "Z"),
+            end=dict(dateTime=(start + timedelta(hours=2)).isoformat() + "Z"),
+            location=(
+                "https://us02web.zoom.us/j/1234" if index % 5 == 0 else "Q2 Stadium"
+            ),
+            description="Synthetic benchmark event.\nSecond line of description.",
+        )
+        if rng.random() < match_share:
+            vs_at = rng.choice(["vs", "at"])
+            raw_event["summary"] = f"Austin FC {vs_at} {rng.choice(team_names)}"
+        if rng.random() < image_share:
+            raw_event["attachments"] = [
+                dict(
+                    fileId=f"benchmark-image-{index % 64}",
+                    mimeType="image/jpeg",
+                    title=f"cover-{index % 64}.jpg",
+                )
+            ]
+        yield raw_event
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_tier(num_events, image_share, match_share, num_categories, seed):
+    from app import configure_app
+    from build_and_publish_site import freeze_site
+    from render_templated_styles import render_templated_styles
+
+    phases = {}
+    wall_start = time.perf_counter()
+
+    phase_start = time.perf_counter()
+    event_categories = generate_event_categories(num_categories)
+    raw_events = list(
+        generate_raw_events(
+            num_events, image_share, match_share, event_categories, seed
+        )
+    )
+    phases["generate_events"] = time.perf_counter() - phase_start
+
+    phase_start = time.perf_counter()
+    calendar = Calendar(
+        service=None,
+        calendar_id="benchmark@losverdesatx.org",
+        display_timezone="US/Central",
+        event_categories=event_categories,
+    )
+    calendar.events = [calendar.new_event(e) for e in raw_events]
+    calendar.events_time_min = raw_events[0]["start"]["dateTime"] if raw_events else ""
+    calendar.events_time_max = raw_events[-1]["end"]["dateTime"] if raw_events else ""
+    calendar.last_refresh = datetime.now()
+    build_context = BuildContext(
+        calendar=calendar,
+        event_categories=event_categories,
+        downloaded_images={},
+    )
+    phases["build_context"] = time.perf_counter() - phase_start
+
+    with tempfile.TemporaryDirectory(prefix="benchmark-build-") as temp_dir:
+        # Render styles into a copy of static/ (with an empty css cache) so the developer's generated styles are
+        # left alone and every tier pays for a full scss compilation
+        static_dir = os.path.join(temp_dir, "static")
+        shutil.copytree(
+            os.path.join(BASE_DIR, "static"),
+            static_dir,
+            ignore=shutil.ignore_patterns(
+                ".webassets-cache", "style.css", "_vars.scss"
+            ),
+        )
+        app = configure_app(
+            build_context=build_context,
+            display_timezone="US/Central",
+            FREEZER_BASE_URL="https://localhost",
+            FREEZER_DESTINATION=os.path.join(temp_dir, "build"),
+        )
+        app.static_folder = static_dir
+
+        phase_start = time.perf_counter()
+        render_templated_styles(
+            app=app,
+            build_context=build_context,
+            scss_dir=os.path.join(static_dir, "scss"),
+            css_cache_dir=os.path.join(temp_dir, ".css_cache"),
+        )
+        phases["render_templated_styles"] = time.perf_counter() - phase_start
+
+        phase_start = time.perf_counter()
+        freeze_site(app=app)
+        phases["freeze_site"] = time.perf_counter() - phase_start
+
+    return dict(
+        num_events=num_events,
+        image_share=image_share,
+        match_share=match_share,
+        num_categories=num_categories,
+        wall_time_secs=time.perf_counter() - wall_start,
+        peak_rss_kb=peak_rss_kb(),
+        phases=phases,
+    )
+
+
+def run_benchmarks(tiers, image_share, match_share, num_categories, seed):
+    results = []
+    # Each tier runs in a fresh interpreter so peak RSS reflects that tier alone
+    mp_context = multiprocessing.get_context("spawn")
+    for num_events in tiers:
+        logger.info(f"Benchmarking build with {num_events=}...")
+        with mp_context.Pool(processes=1, maxtasksperchild=1) as pool:
+            result = pool.apply(
+                run_tier,
+                (num_events, image_share, match_share, num_categories, seed),
+            )
+        logger.info(
+            f"{num_events=} => {result['wall_time_secs']=:.2f} {result['peak_rss_kb']=}"
+        )
+        results.append(result)
+    return results
+
+
+def find_regressions(results, baseline_results, max_regression_pct):
+    baseline_by_tier = {r["num_events"]: r for r in baseline_results}
+    regressions = []
+    for result in results:
+        baseline = baseline_by_tier.get(result["num_events"])
+        if baseline is None:
+            continue
+        for metric in REGRESSION_METRICS:
+            if not baseline.get(metric):
+                continue
+            change_pct = (result[metric] - baseline[metric]) / baseline[metric] * 100
+            if change_pct > max_regression_pct:
+                regressions.append(
+                    dict(
+                        num_events=result["num_events"],
+                        metric=metric,
+                        baseline=baseline[metric],
+                        current=result[metric],
+                        change_pct=round(change_pct, 2),
+                    )
+                )
+    return regressions
+
+
+if __name__ == "__main__":
+    import cli
+
+    parser = cli.build_parser()
+    parser.description = dedent("""\
+        Drive the render_templated_styles + freeze_site path against synthetic calendars.
+        (Drive image downloads are not exercised; synthetic events reference cover images by filename only.)
+        """)
+    parser.add_argument(
+        "-t",
+        "--tiers",
+        default=DEFAULT_TIERS,
+        help="Comma-separated list of calendar sizes (number of events) to benchmark.",
+    )
+    parser.add_argument(
+        "--image-share",
+        type=float,
+        default=DEFAULT_IMAGE_SHARE,
+        help="Share (0-1) of events with an image attachment.",
+    )
+    parser.add_argument(
+        "--match-share",
+        type=float,
+        default=DEFAULT_MATCH_SHARE,
+        help='Share (0-1) of events that are matches (e.g., "Austin FC vs ...").',
+    )
+    parser.add_argument(
+        "--num-categories",
+        type=int,
+        default=DEFAULT_NUM_CATEGORIES,
+        help="Number of event categories to spread events across.",
+    )
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Path to write the JSON results to (in addition to stdout).",
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        help="Path to a previous JSON results file to check for regressions against.",
+    )
+    parser.add_argument(
+        "--max-regression-pct",
+        type=float,
+        default=DEFAULT_MAX_REGRESSION_PCT,
+        help="Fail if wall time or peak RSS for any tier grows by more than this percentage over the baseline.",
+    )
+    args = cli.parse_args(parser)
+
+    results = run_benchmarks(
+        tiers=[int(t) for t in args.tiers.split(",")],
+        image_share=args.image_share,
+        match_share=args.match_share,
+        num_categories=args.num_categories,
+        seed=args.seed,
+    )
+    report = dict(results=results)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline_results = json.load(f)["results"]
+        report["max_regression_pct"] = args.max_regression_pct
+        report["regressions"] = find_regressions(
+            results, baseline_results, args.max_regression_pct
+        )
+
+    report_json = json.dumps(report, indent=2)
+    print(report_json)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report_json)
+
+    if report.get("regressions"):
+        logger.error(f"Performance regressions detected: {report['regressions']=}")
+        sys.exit(1)
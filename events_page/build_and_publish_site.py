@@ -1,16 +1,28 @@
 #!/usr/bin/env python
+import hashlib
 import os
-from time import sleep
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter, sleep
 
 import requests
 from CloudFlare import CloudFlare
+from CloudFlare.exceptions import CloudFlareAPIError
 from flask_frozen import Freezer
 from logzero import logger
+from tenacity import Retrying
+from tenacity.retry import retry_if_exception_type
+from tenacity.stop import stop_after_delay
+from tenacity.wait import wait_exponential
 
 from apis import calendar as gcal
-from apis import drive, storage
+from apis import drive, get_service_registry_report, storage
 from apis.secrets import get_cloudflare_api_token
 from app import create_app, get_base_url
+from build_context import compute_build_fingerprint, load_build_context
+from config import cfg
+from fingerprint import fingerprint_build
+from precompress import precompress_build
 from render_templated_styles import render_templated_styles
 
 
@@ -20,7 +32,22 @@ def freeze_site(app):
     return freeze_result
 
 
-def purge_cache(cf, cloudflare_zone):
+def get_changed_urls(site_hostname, publish_stats):
+    if publish_stats is None:
+        return None
+    changed_urls = []
+    for remote_path in publish_stats["uploaded_paths"] + publish_stats["deleted_paths"]:
+        changed_urls.append(f"https://{site_hostname}/{remote_path}")
+        # Directory indexes are also cached under their "pretty" URL; e.g., / for /index.html
+        if os.path.basename(remote_path) == "index.html":
+            dir_path = os.path.dirname(remote_path)
+            changed_urls.append(
+                f"https://{site_hostname}/{dir_path}{'/' if dir_path else ''}"
+            )
+    return changed_urls
+
+
+def purge_cache(cf, cloudflare_zone, urls=None):
     logger.debug(f"Loading zone info for {cloudflare_zone=}")
     zones = cf.zones.get(params={"per_page": 50, "name": cloudflare_zone})
     if not zones:
@@ -31,6 +58,14 @@ def purge_cache(cf, cloudflare_zone):
     zone_id = zone["id"]
     logger.debug(f"{zone_id=}")
 
+    if urls is not None:
+        try:
+            return purge_urls(cf, zone_id, urls)
+        except CloudFlareAPIError as err:
+            logger.warning(
+                f"Targeted purge of {len(urls)} URLs failed ({err}), falling back to purging everything..."
+            )
+
     purge_data = {
         "purge_everything": True,
     }
@@ -43,23 +78,168 @@ def purge_cache(cf, cloudflare_zone):
     return purge_response
 
 
-def prime_cache(site_hostname, new_paths):
-    logger.info(f"Priming cache / checking responses for {len(new_paths)=}")
-    responses = []
-    for new_path in new_paths:
-        response = requests.get(
-            url=f"https://{site_hostname}{new_path}",
+def purge_urls(cf, zone_id, urls, max_files_per_request=None):
+    if max_files_per_request is None:
+        max_files_per_request = int(cfg.cloudflare_purge_max_files_per_request)
+    purge_responses = []
+    for chunk_start in range(0, len(urls), max_files_per_request):
+        chunk_urls = urls[chunk_start : chunk_start + max_files_per_request]  # noqa
+        logger.info(
+            f"Sending purge_cache request for {zone_id=} with {len(chunk_urls)} files"
+        )
+        logger.debug(f"{chunk_urls=}")
+        purge_response = cf.zones.purge_cache.post(
+            zone_id,
+            data={"files": chunk_urls},
+        )
+        logger.debug(f"{purge_response=}")
+        purge_responses.append(purge_response)
+    return purge_responses
+
+
+def get_expected_responses(site_hostname, uploaded_files, build_id, max_urls=None):
+    """Map a handful of changed URLs to what the edge should serve once the new build has propagated."""
+    if max_urls is None:
+        max_urls = int(cfg.readiness_check_max_urls)
+    # HTML pages carry the build ID so check those first, then whatever else changed
+    remote_paths = sorted(uploaded_files, key=lambda p: (not p.endswith(".html"), p))
+    expected_responses = {}
+    for remote_path in remote_paths[:max_urls]:
+        local_file = uploaded_files[remote_path]
+        if remote_path.endswith(".html"):
+            expected = dict(build_id=build_id)
+        else:
+            with open(local_file, "rb") as f:
+                expected = dict(
+                    md5=hashlib.md5(f.read()).hexdigest(),
+                    content_length=str(os.path.getsize(local_file)),
+                )
+        expected_responses[f"https://{site_hostname}/{remote_path}"] = expected
+    return expected_responses
+
+
+def check_response_is_current(session, url, expected):
+    response = session.get(url, timeout=10)
+    logger.debug(
+        f"{url=}: {response.status_code=} {response.headers.get('CF-Cache-Status')=}"
+    )
+    if "build_id" in expected:
+        assert (
+            f'content="{expected["build_id"]}"' in response.text
+        ), f"{url=} is not yet serving {expected['build_id']=}"
+    else:
+        etag = response.headers.get("ETag", "")
+        content_length = response.headers.get("Content-Length")
+        assert (
+            expected["md5"] in etag or content_length == expected["content_length"]
+        ), f"{url=} is not yet serving the new content ({etag=}, {content_length=})"
+    return response
+
+
+def wait_for_edge_readiness(expected_responses, deadline_secs):
+    """Poll changed URLs concurrently (with backoff) until each serves the new content or the deadline passes."""
+    session = requests.Session()
+
+    def wait_for_url(url):
+        try:
+            for attempt in Retrying(
+                retry=retry_if_exception_type(
+                    (AssertionError, requests.RequestException)
+                ),
+                wait=wait_exponential(multiplier=0.5, max=8),
+                stop=stop_after_delay(deadline_secs),
+            ):
+                with attempt:
+                    check_response_is_current(session, url, expected_responses[url])
+            return True
+        except Exception as err:
+            logger.warning(
+                f"{url=} not confirmed as current within {deadline_secs=}: {err}"
+            )
+            return False
+
+    logger.info(
+        f"Waiting up to {deadline_secs=} for {len(expected_responses)} URLs to update..."
+    )
+    with ThreadPoolExecutor(max_workers=max(len(expected_responses), 1)) as executor:
+        results = dict(
+            zip(expected_responses, executor.map(wait_for_url, expected_responses))
+        )
+    logger.info(f"wait_for_edge_readiness() => {results=}")
+    return all(results.values())
+
+
+def get_prime_cache_urls(base_url, build_dir, new_paths):
+    """Order frozen URL paths for priming: the index page first, then the largest files."""
+
+    def local_size(url_path):
+        local_path = os.path.join(build_dir, url_path.lstrip("/"))
+        if url_path.endswith("/"):
+            local_path = os.path.join(local_path, "index.html")
+        return os.path.getsize(local_path) if os.path.exists(local_path) else 0
+
+    prioritized_paths = sorted(
+        new_paths, key=lambda p: (p not in ("/", "/index.html"), -local_size(p), p)
+    )
+    return [f"{base_url}{p}" for p in prioritized_paths]
+
+
+def prime_url(session, url, timeout_secs):
+    start = perf_counter()
+    try:
+        response = session.get(url, timeout=timeout_secs)
+    except requests.RequestException as err:
+        logger.warning(f"Unable to prime {url=}: {err}")
+        return dict(url=url, status_code=None, cache_status=None, error=str(err))
+    return dict(
+        url=url,
+        status_code=response.status_code,
+        cache_status=response.headers.get("CF-Cache-Status"),
+        content_length=len(response.content),
+        elapsed_secs=round(perf_counter() - start, 4),
+    )
+
+
+def prime_cache(urls, max_workers=None, timeout_secs=10):
+    if max_workers is None:
+        max_workers = int(cfg.prime_cache_workers)
+    logger.info(f"Priming cache / checking responses for {len(urls)=} ({max_workers=})")
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=max_workers, pool_maxsize=max_workers
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        report = list(executor.map(lambda u: prime_url(session, u, timeout_secs), urls))
+
+    for entry in report:
+        logger.debug(f"prime_cache: {entry=}")
+    latencies = sorted(e["elapsed_secs"] for e in report if "elapsed_secs" in e)
+    cache_statuses = Counter(e["cache_status"] for e in report)
+    failed_urls = [
+        e["url"] for e in report if not e["status_code"] or e["status_code"] >= 400
+    ]
+    summary = dict(
+        num_urls=len(report),
+        cache_statuses=dict(cache_statuses),
+        failed_urls=failed_urls,
+    )
+    if latencies:
+        summary.update(
+            p50_secs=latencies[len(latencies) // 2],
+            p95_secs=latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            max_secs=latencies[-1],
         )
-        logger.debug(f"{response=}")
-        logger.debug(f"{response.headers=}")
-        response.raise_for_status()
-        responses.append(response)
-    return responses
+    logger.info(f"prime_cache() => {summary=}")
+    if failed_urls:
+        logger.warning(f"{len(failed_urls)} URLs failed to prime: {failed_urls=}")
+    return report
 
 
-def build_static_site():
+def build_static_site(app):
     logger.info("Freezing site...")
-    freeze_result = freeze_site(app=create_app())
+    freeze_result = freeze_site(app=app)
     logger.info(f"build_static_site() => {freeze_result}")
     return freeze_result
 
@@ -69,28 +249,68 @@ def build_and_publish_site(
     cloudflare_zone,
     purge_delay_secs,
     gcs_bucket_prefix,
+    force=False,
 ):
-    render_templated_styles(
-        app=create_app(),
+    build_context = load_build_context(
         gcal_service=gcal.build_service(),
         drive_service=drive.build_service(),
     )
+    storage_client = storage.get_client()
+    build_fingerprint = compute_build_fingerprint(build_context)
+    published_fingerprint = storage.get_published_build_fingerprint(
+        client=storage_client,
+        bucket_id=site_hostname,
+        prefix=gcs_bucket_prefix,
+    )
+    if build_fingerprint == published_fingerprint and not force:
+        logger.info(
+            f"Build inputs unchanged since last publication ({build_fingerprint=}), nothing to do!"
+        )
+        return
+    app = create_app(build_context=build_context)
+    render_templated_styles(app=app, build_context=build_context)
 
-    static_site_files = build_static_site()
+    static_site_files = build_static_site(app=app)
+    renamed_urls = fingerprint_build()
+    static_site_files = {renamed_urls.get(u, u) for u in static_site_files}
     logger.debug(f"{static_site_files=}")
 
-    storage.upload_build_to_gcs(
-        client=storage.get_client(),
+    precompressed_files = precompress_build()
+
+    publish_stats = storage.upload_build_to_gcs(
+        client=storage_client,
         bucket_id=site_hostname,
         prefix=gcs_bucket_prefix,
+        precompressed_files=precompressed_files,
     )
-    if cloudflare_zone is not None and not gcs_bucket_prefix:
+    storage.set_published_build_fingerprint(
+        client=storage_client,
+        bucket_id=site_hostname,
+        prefix=gcs_bucket_prefix,
+        build_fingerprint=build_fingerprint,
+    )
+    logger.debug(f"{publish_stats=}")
+    changed_urls = get_changed_urls(site_hostname, publish_stats)
+    if changed_urls == []:
+        logger.info("No published objects changed, skipping cache purge...")
+    elif cloudflare_zone is not None and not gcs_bucket_prefix:
         purge_cache(
             CloudFlare(token=get_cloudflare_api_token()),
             cloudflare_zone=cloudflare_zone,
+            urls=changed_urls,
         )
-        logger.info(f"Waiting for {purge_delay_secs=} before proceeding...")
-        sleep(purge_delay_secs)
+        if publish_stats is not None:
+            wait_for_edge_readiness(
+                expected_responses=get_expected_responses(
+                    site_hostname=site_hostname,
+                    uploaded_files=publish_stats["uploaded_files"],
+                    build_id=app.config["BUILD_ID"],
+                ),
+                deadline_secs=float(purge_delay_secs),
+            )
+        else:
+            logger.info(f"Waiting for {purge_delay_secs=} before proceeding...")
+            sleep(float(purge_delay_secs))
     else:
         if cloudflare_zone is None:
             logger.warning(
@@ -101,15 +321,23 @@ def build_and_publish_site(
                 f"Skipping cache purge bits as we're deploying to a prefix {gcs_bucket_prefix=}..."
             )
 
-    logger.warning(
-        '"priming" the cache may be causing more issues than it is worth, skipping for now...'
+    base_url = f"https://{site_hostname}"
+    if gcs_bucket_prefix:
+        base_url = f"{base_url}/{gcs_bucket_prefix.strip('/')}"
+    prime_cache(
+        urls=get_prime_cache_urls(
+            base_url=base_url,
+            build_dir=os.path.join(
+                app.root_path, app.config.get("FREEZER_DESTINATION", "build")
+            ),
+            new_paths=static_site_files,
+        ),
     )
-    # prime_cache(site_hostname=site_hostname, new_paths=static_site_files)
+    logger.info(f"Shared Google API clients: {get_service_registry_report()=}")
 
 
 if __name__ == "__main__":
     import cli
-    from config import cfg
 
     cfg.load()
     parser = cli.build_parser()
@@ -136,7 +364,13 @@ if __name__ == "__main__":
         "-p",
         "--purge-delay-secs",
         default=cfg.purge_delay_secs,
-        help="How long to wait to test site response after purging cache post-publication",
+        help="How long to wait (at most) for the site to serve published changes after purging cache post-publication",
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="Build and publish even if build inputs match those of the last published build.",
     )
     args = cli.parse_args(parser)
 
@@ -152,6 +386,7 @@ if __name__ == "__main__":
         cloudflare_zone=args.cloudflare_zone,
         purge_delay_secs=args.purge_delay_secs,
         gcs_bucket_prefix=args.gcs_bucket_prefix,
+        force=args.force,
     )
 
     logger.info(f"Publication of site to {args.site_hostname} completed! 🎉")
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+import glob
+import hashlib
+import json
+import os
+
+from logzero import logger
+
+from apis import calendar as gcal
+from apis.drive import (
+    add_category_image_file_metadata,
+    download_category_images,
+    download_event_images,
+    get_category_image_file_id,
+    get_event_image_attachments_by_file_id,
+    get_files_metadata,
+)
+from apis.http_cache import get_http_cache_stats
+from apis.image_cache import ImageCache
+from config import cfg
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+# Code, templates, and styles that (alongside the fetched data) determine the rendered site
+BUILD_SOURCE_GLOBS = [
+    "*.py",
+    "apis/*.py",
+    "requirements.txt",
+    "templates/*",
+    "static/*.ico",
+    "static/scss/*.scss",
+]
+GENERATED_SOURCES = {"static/scss/_vars.scss"}
+
+
+class BuildContext(object):
+    """Data fetched once per build and shared by the styles render and site freeze steps."""
+
+    def __init__(self, calendar, event_categories, downloaded_images) -> None:
+        self.calendar = calendar
+        self.event_categories = event_categories
+        self.downloaded_images = downloaded_images
+
+    @property
+    def events(self):
+        return self.calendar.events or []
+
+
+def normalize_event(event):
+    normalized_event = {slot: getattr(event, slot) for slot in event.__slots__}
+    # Whether an event is in the past depends on when we build, not only on the event itself
+    normalized_event["in_past"] = event.in_past
+    return normalized_event
+
+
+def hash_build_sources(fingerprint, base_dir=BASE_DIR):
+    for source_glob in BUILD_SOURCE_GLOBS:
+        for source_path in sorted(glob.glob(os.path.join(base_dir, source_glob))):
+            relative_path = os.path.relpath(source_path, base_dir)
+            if relative_path in GENERATED_SOURCES or not os.path.isfile(source_path):
+                continue
+            fingerprint.update(relative_path.encode("utf-8"))
+            with open(source_path, "rb") as f:
+                fingerprint.update(f.read())
+
+
+def compute_build_fingerprint(build_context, config=None, static_dir=STATIC_DIR):
+    """Hash everything that goes into the rendered site, so a build identical to the last published one can be skipped.
+
+    calendar.last_refresh is deliberately left out; otherwise no two builds would ever match.
+    """
+    if config is None:
+        config = cfg.to_resolved_dict()
+    calendar = build_context.calendar
+    build_inputs = dict(
+        config=config,
+        calendar_id=calendar.calendar_id,
+        events_dates=[
+            str(calendar.events_time_min)[:10],
+            str(calendar.events_time_max)[:10],
+        ],
+        events=[normalize_event(e) for e in build_context.events],
+        event_categories=build_context.event_categories,
+        images={},
+    )
+    for image_name, filename in sorted(build_context.downloaded_images.items()):
+        image_path = os.path.join(static_dir, filename)
+        if not os.path.exists(image_path):
+            # Failed downloads are logged (not raised) by download_image(); the build renders without them
+            logger.warning(f"Fingerprinting build without missing image: {image_path=}")
+            build_inputs["images"][image_name] = None
+            continue
+        with open(image_path, "rb") as f:
+            build_inputs["images"][image_name] = hashlib.md5(f.read()).hexdigest()
+
+    fingerprint = hashlib.sha256()
+    fingerprint.update(
+        json.dumps(build_inputs, sort_keys=True, default=str).encode("utf-8")
+    )
+    hash_build_sources(fingerprint)
+    logger.info(f"compute_build_fingerprint() => {fingerprint.hexdigest()}")
+    return fingerprint.hexdigest()
+
+
+def download_all_remote_images(
+    drive_service, calendar, event_categories, files_metadata=None
+):
+    image_cache = ImageCache()
+    downloaded_images = dict()
+    downloaded_images.update(
+        download_event_images(
+            drive_service,
+            calendar.events or [],
+            files_metadata=files_metadata,
+            image_cache=image_cache,
+        )
+    )
+    downloaded_images.update(
+        download_category_images(
+            drive_service, event_categories, image_cache=image_cache
+        )
+    )
+    image_cache.finalize()
+    logger.info(f"download_all_remote_images() => {downloaded_images=}")
+    return downloaded_images
+
+
+def load_build_context(gcal_service, drive_service):
+    logger.info("Loading build context (calendar events, categories, and images)...")
+    calendar = gcal.load_calendar(
+        service=gcal_service,
+        calendar_id=cfg.calendar_id,
+    )
+    event_categories = cfg.event_categories
+
+    # Look up metadata for every event attachment and category cover image in as few batch requests as possible
+    file_ids = list(get_event_image_attachments_by_file_id(calendar.events or []))
+    file_ids += [
+        file_id
+        for file_id in map(get_category_image_file_id, event_categories.values())
+        if file_id
+    ]
+    files_metadata = get_files_metadata(drive_service, file_ids)
+
+    event_categories = add_category_image_file_metadata(
+        drive_service=drive_service,
+        event_categories=event_categories,
+        files_metadata=files_metadata,
+    )
+    downloaded_images = download_all_remote_images(
+        drive_service=drive_service,
+        calendar=calendar,
+        event_categories=event_categories,
+        files_metadata=files_metadata,
+    )
+    logger.info(f"Conditional request cache: {get_http_cache_stats()=}")
+    return BuildContext(
+        calendar=calendar,
+        event_categories=event_categories,
+        downloaded_images=downloaded_images,
+    )
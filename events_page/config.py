@@ -2,6 +2,8 @@
 import json
 import os
 import re
+import tempfile
+import time
 
 import hcl
 from logzero import logger
@@ -11,11 +13,28 @@ from apis.constants import CalendarColors
 
 # phases of the 🌙
 DEFAULT_CALENDAR_ID = "information@losverdesatx.org"
+DEFAULT_CALENDAR_PAGE_SIZE = 2500
+DEFAULT_CALENDAR_SYNC_MODE = "incremental"
+# Cloudflare's per-request limit on purge-by-URL for non-enterprise zones
+DEFAULT_CLOUDFLARE_PURGE_MAX_FILES_PER_REQUEST = 30
+DEFAULT_CONFIG_TTL_SECS = 300
 DEFAULT_DISPLAY_TIMEZONE = "US/Central"
+DEFAULT_DRIVE_DOWNLOAD_WORKERS = 8
 DEFAULT_FOLDER_NAME = "calendar-event-images"
+DEFAULT_GCS_PUBLISH_MODE = "sync"
+DEFAULT_GCS_SYNC_PRESERVED_PREFIXES = "tests/"
+DEFAULT_GCS_TRANSFER_WORKERS = 16
 DEFAULT_GITHUB_REPO = "los-verdes/lv-event-pagenerator"
 DEFAULT_HOSTNAME = "localhost"
+DEFAULT_IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_PRECOMPRESS_MIN_SAVINGS_PCT = 10
+DEFAULT_PRIME_CACHE_WORKERS = 8
 DEFAULT_PURGE_DELAY_SECS = 30
+DEFAULT_PUSH_QUIET_WINDOW_SECS = 15
+DEFAULT_PUSH_STATE_DB_PATH = os.path.join(
+    tempfile.gettempdir(), "events_page_push_state.sqlite3"
+)
+DEFAULT_READINESS_CHECK_MAX_URLS = 5
 DEFAULT_WATCH_EXPIRATION_IN_DAYS = 7
 DEFAULT_WEBHOOK_URL = "https://us-central1-losverdesatx-events.cloudfunctions.net/push-webhook-receiver"
 
@@ -28,14 +47,29 @@ class Config(object):
     overrides = dict()
     defaults = dict(
         calendar_id=DEFAULT_CALENDAR_ID,
+        calendar_page_size=DEFAULT_CALENDAR_PAGE_SIZE,
+        calendar_sync_mode=DEFAULT_CALENDAR_SYNC_MODE,
+        cloudflare_purge_max_files_per_request=DEFAULT_CLOUDFLARE_PURGE_MAX_FILES_PER_REQUEST,
+        config_ttl_secs=DEFAULT_CONFIG_TTL_SECS,
         display_timezone=DEFAULT_DISPLAY_TIMEZONE,
+        drive_download_workers=DEFAULT_DRIVE_DOWNLOAD_WORKERS,
         gcs_bucket_prefix="",
+        gcs_publish_mode=DEFAULT_GCS_PUBLISH_MODE,
+        gcs_sync_preserved_prefixes=DEFAULT_GCS_SYNC_PRESERVED_PREFIXES,
+        gcs_transfer_workers=DEFAULT_GCS_TRANSFER_WORKERS,
         hostname=DEFAULT_HOSTNAME,
+        image_cache_max_bytes=DEFAULT_IMAGE_CACHE_MAX_BYTES,
+        precompress_min_savings_pct=DEFAULT_PRECOMPRESS_MIN_SAVINGS_PCT,
+        prime_cache_workers=DEFAULT_PRIME_CACHE_WORKERS,
         purge_delay_secs=DEFAULT_PURGE_DELAY_SECS,
+        push_quiet_window_secs=DEFAULT_PUSH_QUIET_WINDOW_SECS,
+        push_state_db_path=DEFAULT_PUSH_STATE_DB_PATH,
+        readiness_check_max_urls=DEFAULT_READINESS_CHECK_MAX_URLS,
         watch_expiration_in_days=DEFAULT_WATCH_EXPIRATION_IN_DAYS,
         webhook_url=DEFAULT_WEBHOOK_URL,
     )
     _secretsmanager_config = dict()
+    _secretsmanager_config_loaded_at = None
 
     @property
     def hostname(self):
@@ -68,10 +102,15 @@ class Config(object):
     def load(self):
         from apis.secrets import get_secretsmanager_config
 
-        if not self._secretsmanager_config:
+        # Warm processes (e.g., the webhook function) call load() per request; only re-read the config once stale
+        loaded_at = self._secretsmanager_config_loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at >= float(
+            self.config_ttl_secs
+        ):
             self._secretsmanager_config = get_secretsmanager_config(
-                credentials=load_credentials()
+                credentials=load_credentials() if loaded_at is None else None
             )
+            self._secretsmanager_config_loaded_at = time.monotonic()
         if tfvars_path := os.getenv("EVENTS_PAGE_LOAD_LOCAL_TF_VARS"):
             with open(tfvars_path) as f:
                 tfvars = hcl.load(f)
@@ -105,6 +144,20 @@ class Config(object):
                 config_dict[friendly_key] = v
         return config_dict
 
+    def to_resolved_dict(self):
+        """Effective value for every known key, with the same precedence as __getattr__()."""
+        environ_config = {
+            key_match.groupdict()["key"].lower(): v
+            for k, v in os.environ.items()
+            if v and (key_match := self.key_re.match(k))
+        }
+        return {
+            **self.defaults,
+            **{k: v for k, v in self._secretsmanager_config.items() if v},
+            **environ_config,
+            **self.overrides,
+        }
+
 
 cfg = Config()
 logger.debug(f"Config loaded from environment: {cfg.to_dict()=}")
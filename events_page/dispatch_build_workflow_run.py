@@ -41,6 +41,11 @@ if __name__ == "__main__":
             """
         ),
     )
+    parser.add_argument(
+        "--no-wait",
+        action="store_true",
+        help="Return once the dispatch is accepted instead of waiting for the resulting workflow run to appear.",
+    )
     args = cli.parse_args(parser)
 
     github_client = get_github_client(
@@ -59,8 +64,12 @@ if __name__ == "__main__":
             github_client=github_client,
             github_ref=args.github_ref,
             workflow_filename=args.workflow_filename,
+            wait_for_run=not args.no_wait,
         )
         logger.debug(f"result: {dispatched_workflow_run=}")
-        logger.info(f"{dispatched_workflow_run.id=}: {dispatched_workflow_run.status=}")
+        if dispatched_workflow_run is not None:
+            logger.info(
+                f"{dispatched_workflow_run.id=}: {dispatched_workflow_run.status=}"
+            )
     except SuperfluousDispatchException as err:
         logger.warning(f"SuperfluousDispatchException: {err=}")
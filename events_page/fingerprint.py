@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+import hashlib
+import os
+import re
+
+from logzero import logger
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+BUILD_DIR = os.path.join(BASE_DIR, "build")
+STATIC_DIRNAME = "static"
+HASH_LENGTH = 12
+REWRITTEN_EXTENSIONS = (".css", ".html")
+
+
+def fingerprinted_filename(filename, content):
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{hashlib.md5(content).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+def rewrite_references(local_file, renamed_urls):
+    with open(local_file, "r", encoding="utf-8") as f:
+        content = f.read()
+    rewritten = content
+    for url_path, fingerprinted_url_path in renamed_urls.items():
+        # Drop any cache-busting query string (e.g., webassets' "?<version>") along with the old name
+        rewritten = re.sub(
+            rf"{re.escape(url_path)}(\?[^\"'\s)]*)?(?=[\"'\s)]|$)",
+            fingerprinted_url_path,
+            rewritten,
+        )
+    if rewritten != content:
+        logger.debug(f"Rewrote fingerprinted asset references in {local_file=}")
+        with open(local_file, "w", encoding="utf-8") as f:
+            f.write(rewritten)
+
+
+def fingerprint_build(build_dir=BUILD_DIR):
+    """Rename the build's static assets to content-hashed filenames and point HTML / CSS at the new names.
+
+    Returns a mapping of original URL paths (as produced by the freezer) to their fingerprinted ones.
+    """
+    static_dir = os.path.join(build_dir, STATIC_DIRNAME)
+    static_files = []
+    for dirpath, dirnames, filenames in os.walk(static_dir):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        static_files += [
+            os.path.join(dirpath, f) for f in filenames if not f.startswith(".")
+        ]
+    # Compiled CSS references (Drive) images, so those need their final names before the CSS is hashed
+    static_files.sort(key=lambda f: (f.endswith(REWRITTEN_EXTENSIONS), f))
+
+    renamed_urls = {}
+    for local_file in static_files:
+        if local_file.endswith(REWRITTEN_EXTENSIONS):
+            rewrite_references(local_file, renamed_urls)
+        with open(local_file, "rb") as f:
+            content = f.read()
+        fingerprinted_file = os.path.join(
+            os.path.dirname(local_file),
+            fingerprinted_filename(os.path.basename(local_file), content),
+        )
+        os.replace(local_file, fingerprinted_file)
+        url_path = f"/{os.path.relpath(local_file, build_dir)}"
+        renamed_urls[url_path] = f"/{os.path.relpath(fingerprinted_file, build_dir)}"
+
+    for dirpath, dirnames, filenames in os.walk(build_dir):
+        if os.path.commonpath([dirpath, static_dir]) == static_dir:
+            continue
+        for filename in filenames:
+            if filename.endswith(".html"):
+                rewrite_references(os.path.join(dirpath, filename), renamed_urls)
+
+    logger.info(f"fingerprint_build() => {len(renamed_urls)} static assets renamed")
+    logger.debug(f"{renamed_urls=}")
+    return renamed_urls
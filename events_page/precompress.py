@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+import gzip
+import mimetypes
+import os
+import shutil
+
+from logzero import logger
+
+from config import cfg
+
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+BUILD_DIR = os.path.join(BASE_DIR, "build")
+PRECOMPRESSED_DIR = os.path.join(BASE_DIR, ".precompressed")
+COMPRESSIBLE_MIME_TYPES = {
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+}
+
+
+def is_compressible(local_file):
+    mime_type, encoding = mimetypes.guess_type(local_file)
+    if mime_type is None or encoding is not None:
+        return False
+    return mime_type.startswith("text/") or mime_type in COMPRESSIBLE_MIME_TYPES
+
+
+def gzip_file(local_file, compressed_file):
+    with open(local_file, "rb") as f:
+        content = f.read()
+    # A fixed mtime keeps the output byte-identical between runs (so unchanged files are skipped at sync time)
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    os.makedirs(os.path.dirname(compressed_file), exist_ok=True)
+    with open(compressed_file, "wb") as f:
+        f.write(compressed)
+    return len(content), len(compressed)
+
+
+def precompress_build(
+    build_dir=BUILD_DIR, output_dir=PRECOMPRESSED_DIR, min_savings_pct=None
+):
+    """Write gzip variants of the build's text assets to output_dir.
+
+    Returns a mapping of each build file worth serving compressed to its gzipped variant; files whose
+    compressed size does not save at least min_savings_pct are left out (and uploaded as-is).
+    """
+    if min_savings_pct is None:
+        min_savings_pct = float(cfg.precompress_min_savings_pct)
+    shutil.rmtree(output_dir, ignore_errors=True)
+
+    precompressed_files = {}
+    original_bytes = compressed_bytes = 0
+    for dirpath, dirnames, filenames in os.walk(build_dir):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for filename in filenames:
+            local_file = os.path.join(dirpath, filename)
+            if filename.startswith(".") or not is_compressible(local_file):
+                continue
+            compressed_file = os.path.join(
+                output_dir, os.path.relpath(local_file, build_dir)
+            )
+            original_size, compressed_size = gzip_file(local_file, compressed_file)
+            savings_pct = (1 - compressed_size / max(original_size, 1)) * 100
+            if savings_pct < min_savings_pct:
+                logger.debug(
+                    f"Not precompressing {local_file=} ({savings_pct=:.1f} < {min_savings_pct=})"
+                )
+                os.remove(compressed_file)
+                continue
+            precompressed_files[local_file] = compressed_file
+            original_bytes += original_size
+            compressed_bytes += compressed_size
+
+    logger.info(
+        f"precompress_build() => {len(precompressed_files)} files gzipped "
+        f"({original_bytes=} => {compressed_bytes=})"
+    )
+    return precompressed_files
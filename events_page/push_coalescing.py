@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+"""De-duplicate and debounce Google push notifications so a burst of edits results in a single build dispatch.
+
+State lives behind PushStateStore; SqlitePushStateStore (the default) keeps it in a local SQLite file, which is
+shared by all requests handled by a given process / function instance.
+"""
+
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from functools import lru_cache
+
+from logzero import logger
+
+from config import cfg
+
+NEW_MESSAGE = "new"
+DUPLICATE_MESSAGE = "duplicate"
+OUT_OF_ORDER_MESSAGE = "out_of_order"
+
+RECEIVED_COUNTER = "received"
+COALESCED_COUNTER = "coalesced"
+DISPATCHED_COUNTER = "dispatched"
+RELEASED_COUNTER = "released"
+
+
+class PushStateStore(ABC):
+    """Interface for coalescing state; implementations must make each method atomic across concurrent callers."""
+
+    @abstractmethod
+    def record_message(self, channel_id, message_number):
+        """Track a channel's message_number; returns (message status, the channel's previous message_number)."""
+
+    @abstractmethod
+    def release_message(self, channel_id, message_number, previous_message_number):
+        """Undo record_message() (if nothing newer was recorded since) so a redelivery is treated as new."""
+
+    @abstractmethod
+    def claim_dispatch(self, dispatched_at, quiet_window_secs):
+        """Record a dispatch unless one happened within the window; returns (claimed, previous dispatch time)."""
+
+    @abstractmethod
+    def release_dispatch(self, dispatched_at, previous_dispatched_at):
+        """Undo claim_dispatch() (if no later dispatch was claimed since)."""
+
+    @abstractmethod
+    def increment(self, counter, amount=1):
+        pass
+
+    @abstractmethod
+    def counts(self):
+        pass
+
+
+class SqlitePushStateStore(PushStateStore):
+    def __init__(self, db_path) -> None:
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        with self.connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS channels (
+                    channel_id TEXT PRIMARY KEY,
+                    last_message_number INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS dispatches (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    last_dispatched_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    count INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO dispatches (id, last_dispatched_at) VALUES (0, NULL);
+                """)
+
+    @contextmanager
+    def connect(self):
+        # isolation_level=None so BEGIN IMMEDIATE below takes the write lock up front
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def record_message(self, channel_id, message_number):
+        with self._lock, self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT last_message_number FROM channels WHERE channel_id = ?",
+                (channel_id,),
+            ).fetchone()
+            previous_message_number = row[0] if row is not None else None
+            if row is not None and message_number <= row[0]:
+                conn.execute("COMMIT")
+                if message_number == row[0]:
+                    return DUPLICATE_MESSAGE, previous_message_number
+                return OUT_OF_ORDER_MESSAGE, previous_message_number
+            conn.execute(
+                "INSERT OR REPLACE INTO channels (channel_id, last_message_number) VALUES (?, ?)",
+                (channel_id, message_number),
+            )
+            conn.execute("COMMIT")
+            return NEW_MESSAGE, previous_message_number
+
+    def release_message(self, channel_id, message_number, previous_message_number):
+        with self._lock, self.connect() as conn:
+            if previous_message_number is None:
+                conn.execute(
+                    "DELETE FROM channels WHERE channel_id = ? AND last_message_number = ?",
+                    (channel_id, message_number),
+                )
+                return
+            conn.execute(
+                "UPDATE channels SET last_message_number = ? "
+                "WHERE channel_id = ? AND last_message_number = ?",
+                (previous_message_number, channel_id, message_number),
+            )
+
+    def claim_dispatch(self, dispatched_at, quiet_window_secs):
+        with self._lock, self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            (previous_dispatched_at,) = conn.execute(
+                "SELECT last_dispatched_at FROM dispatches WHERE id = 0"
+            ).fetchone()
+            if (
+                previous_dispatched_at is not None
+                and dispatched_at - previous_dispatched_at < quiet_window_secs
+            ):
+                conn.execute("COMMIT")
+                return False, previous_dispatched_at
+            conn.execute(
+                "UPDATE dispatches SET last_dispatched_at = ? WHERE id = 0",
+                (dispatched_at,),
+            )
+            conn.execute("COMMIT")
+            return True, previous_dispatched_at
+
+    def release_dispatch(self, dispatched_at, previous_dispatched_at):
+        with self._lock, self.connect() as conn:
+            conn.execute(
+                "UPDATE dispatches SET last_dispatched_at = ? "
+                "WHERE id = 0 AND last_dispatched_at = ?",
+                (previous_dispatched_at, dispatched_at),
+            )
+
+    def increment(self, counter, amount=1):
+        with self._lock, self.connect() as conn:
+            conn.execute(
+                "INSERT INTO counters (name, count) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET count = count + excluded.count",
+                (counter, amount),
+            )
+
+    def counts(self):
+        with self._lock, self.connect() as conn:
+            return dict(conn.execute("SELECT name, count FROM counters").fetchall())
+
+
+class PushCoalescer(object):
+    def __init__(self, store, quiet_window_secs) -> None:
+        self.store = store
+        self.quiet_window_secs = quiet_window_secs
+
+    def claim_dispatch(self, push):
+        """Decide whether this push should dispatch a build, returning a claim to pass to release() if so.
+
+        Duplicate and out-of-order messages are dropped, as are pushes arriving within quiet_window_secs of the
+        last dispatch: the build that dispatch triggers has yet to load the calendar, so it picks their edits up.
+        Nothing sleeps here, so each push is acknowledged right away.
+        """
+        self.store.increment(RECEIVED_COUNTER)
+        channel_id = push["channel_id"]
+        message_number = int(push["message_number"])
+        status, previous_message_number = self.store.record_message(
+            channel_id=channel_id,
+            message_number=message_number,
+        )
+        if status != NEW_MESSAGE:
+            logger.info(f"Dropping {status} push: {channel_id=} {message_number=}")
+            self.store.increment(status)
+            return None
+
+        dispatched_at = time.time()
+        claimed, previous_dispatched_at = self.store.claim_dispatch(
+            dispatched_at=dispatched_at,
+            quiet_window_secs=self.quiet_window_secs,
+        )
+        if not claimed:
+            logger.info(
+                f"Coalescing push {message_number=} into the build dispatched at {previous_dispatched_at=}"
+            )
+            self.store.increment(COALESCED_COUNTER)
+            return None
+        return dict(
+            channel_id=channel_id,
+            message_number=message_number,
+            previous_message_number=previous_message_number,
+            dispatched_at=dispatched_at,
+            previous_dispatched_at=previous_dispatched_at,
+        )
+
+    def release(self, claim):
+        """Forget a claimed push whose dispatch failed, so Google's redelivery of it gets dispatched."""
+        logger.warning(f"Releasing push after a failed dispatch: {claim=}")
+        self.store.release_message(
+            channel_id=claim["channel_id"],
+            message_number=claim["message_number"],
+            previous_message_number=claim["previous_message_number"],
+        )
+        self.store.release_dispatch(
+            dispatched_at=claim["dispatched_at"],
+            previous_dispatched_at=claim["previous_dispatched_at"],
+        )
+        self.store.increment(RELEASED_COUNTER)
+
+    def record_dispatch(self):
+        self.store.increment(DISPATCHED_COUNTER)
+
+    def counts(self):
+        return self.store.counts()
+
+
+@lru_cache(maxsize=None)
+def build_push_coalescer(db_path, quiet_window_secs):
+    return PushCoalescer(
+        store=SqlitePushStateStore(db_path=db_path),
+        quiet_window_secs=quiet_window_secs,
+    )
+
+
+def get_push_coalescer():
+    # Reused across requests handled by a warm process, so the schema setup only happens once
+    return build_push_coalescer(
+        db_path=cfg.push_state_db_path,
+        quiet_window_secs=float(cfg.push_quiet_window_secs),
+    )
@@ -1,20 +1,22 @@
 #!/usr/bin/env python
+import filecmp
+import hashlib
 import os
+import shutil
+import tempfile
 
 import flask
 from logzero import logger
 
 from apis import calendar as gcal
-from apis.drive import (
-    add_category_image_file_metadata,
-    build_service,
-    download_event_images,
-    download_category_images,
-)
+from apis import drive
 from apis.mls import TeamColors
-from config import cfg
+from build_context import load_build_context
 
 BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+SCSS_DIR = os.path.join(BASE_DIR, "static", "scss")
+CSS_CACHE_DIR = os.path.join(BASE_DIR, ".css_cache")
+MAX_CACHED_STYLESHEETS = 20
 
 
 def get_always_shown_categories(event_categories):
@@ -24,7 +26,9 @@ def get_always_shown_categories(event_categories):
     return always_shown_categories
 
 
-def render_scss_vars_template(app, calendar, event_categories, team_colors):
+def render_scss_vars_template(
+    app, calendar, event_categories, team_colors, scss_dir=SCSS_DIR
+):
     if not event_categories:
         logger.warning(
             "No event categories provided in settings. Styling may be somewhat jank as a result. T.T"
@@ -58,7 +62,7 @@ def render_scss_vars_template(app, calendar, event_categories, team_colors):
         if text_bg_color := event_category.get("text_bg_color"):
             event_category_text_bg_colors[class_name] = text_bg_color
 
-    for event in calendar.events:
+    for event in calendar.events or []:
         class_name = event.event_specific_css_class
         logger.debug(f"{class_name=} {event.get('cover_image_filename')}")
         if cover_image_filename := event.cover_image_filename:
@@ -76,52 +80,100 @@ def render_scss_vars_template(app, calendar, event_categories, team_colors):
         )
 
     logger.debug(f"{rendered_scss=}")
-    output_path = os.path.join(BASE_DIR, "static", "scss", "_vars.scss")
+    output_path = os.path.join(scss_dir, "_vars.scss")
+    if os.path.exists(output_path):
+        with open(output_path, "r") as f:
+            if f.read() == rendered_scss:
+                # Leave the file (and its mtime) alone so webassets doesn't consider the bundle outdated
+                logger.info(f"Templated scss unchanged, not rewriting: {output_path=}")
+                return
     logger.info(f"Writing out templated scss to: {output_path=}")
     with open(output_path, "w") as f:
         f.write(rendered_scss)
 
 
-def download_all_remote_images(drive_service, calendar, event_categories):
-    downloaded_images = dict()
-    downloaded_images.update(download_event_images(drive_service, calendar.events))
-    downloaded_images.update(download_category_images(drive_service, event_categories))
-    logger.info(f"download_all_remote_images() => {downloaded_images=}")
-    return downloaded_images
+def hash_scss_inputs(scss_dir=SCSS_DIR):
+    inputs_hash = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(scss_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            scss_path = os.path.join(dirpath, filename)
+            inputs_hash.update(os.path.relpath(scss_path, scss_dir).encode("utf-8"))
+            with open(scss_path, "rb") as f:
+                inputs_hash.update(f.read())
+    return inputs_hash.hexdigest()
 
 
-def render_templated_styles(app, gcal_service, drive_service):
-    logger.info("Rendering templated styles...")
-    event_categories = cfg.event_categories
-    event_categories = add_category_image_file_metadata(
-        drive_service=drive_service, event_categories=event_categories
-    )
-    calendar = gcal.load_calendar(
-        service=gcal_service,
-        calendar_id=cfg.calendar_id,
+def prune_css_cache(cache_dir, max_entries=MAX_CACHED_STYLESHEETS):
+    cached_paths = sorted(
+        (os.path.join(cache_dir, f) for f in os.listdir(cache_dir)),
+        key=os.path.getmtime,
+        reverse=True,
     )
-    download_all_remote_images(
-        drive_service=drive_service,
-        calendar=calendar,
-        event_categories=event_categories,
+    for cached_path in cached_paths[max_entries:]:
+        logger.debug(f"Pruning {cached_path=} from compiled css cache")
+        os.remove(cached_path)
+
+
+def compile_styles(
+    app, bundle_name="style", cache_dir=CSS_CACHE_DIR, scss_dir=SCSS_DIR
+):
+    """Build the scss bundle, reusing a previous compilation of identical inputs where available."""
+    assets_env = app.jinja_env.assets_environment
+    bundle = assets_env[bundle_name]
+    output_path = os.path.join(assets_env.directory, bundle.output)
+    cached_path = os.path.join(cache_dir, f"{hash_scss_inputs(scss_dir)}.css")
+
+    if os.path.exists(cached_path):
+        logger.info(f"Reusing compiled styles from {cached_path=}")
+        os.utime(cached_path)
+        if not os.path.exists(output_path) or not filecmp.cmp(
+            cached_path, output_path, shallow=False
+        ):
+            shutil.copyfile(cached_path, output_path)
+        return output_path
+
+    logger.info(
+        f"No cached compilation for current scss inputs, building {bundle_name=}..."
     )
+    with app.app_context():
+        bundle.build(force=True)
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False) as f:
+        with open(output_path, "rb") as output:
+            f.write(output.read())
+    os.replace(f.name, cached_path)
+    prune_css_cache(cache_dir)
+    return output_path
+
+
+def render_templated_styles(
+    app, build_context, scss_dir=SCSS_DIR, css_cache_dir=CSS_CACHE_DIR
+):
+    logger.info("Rendering templated styles...")
     render_scss_vars_template(
         app=app,
-        calendar=calendar,
-        event_categories=event_categories,
+        calendar=build_context.calendar,
+        event_categories=build_context.event_categories,
         team_colors=TeamColors(),
+        scss_dir=scss_dir,
     )
+    compile_styles(app=app, cache_dir=css_cache_dir, scss_dir=scss_dir)
 
 
 if __name__ == "__main__":
     import cli
     from app import create_app
+    from config import cfg
 
     cfg.load()
     args = cli.parse_args(cli.build_parser())
 
-    render_templated_styles(
-        app=create_app(),
+    build_context = load_build_context(
         gcal_service=gcal.build_service(),
-        drive_service=build_service(),
+        drive_service=drive.build_service(),
+    )
+    render_templated_styles(
+        app=create_app(build_context=build_context),
+        build_context=build_context,
     )
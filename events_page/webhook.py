@@ -1,13 +1,16 @@
 #!/usr/bin/env python
 import logging
 import re
+import time
 
 import logzero
 from logzero import logger
 
+from apis.github import SuperfluousDispatchException
 from apis.secrets import get_gh_app_key, get_webhook_token
 from config import cfg
 from dispatch_build_workflow_run import dispatch_build_workflow_run, get_github_client
+from push_coalescing import get_push_coalescer
 
 uri_regexp = re.compile(
     r"https://www.googleapis.com/drive/v3/files/(?P<file_id>[^?]+).*"
@@ -29,20 +32,40 @@ def process_push_notification(request):
         Response object using
         `make_response <http://flask.pocoo.org/docs/1.0/api/#flask.Flask.make_response>`.
     """
-    cfg.load()
+    request_start = time.perf_counter()
+    # Reject unauthorized pushes before loading config or setting up any (GitHub, etc.) clients
     try:
         push = parse_push(req_headers=request.headers)
     except UnauthorizedChannelTokenException as err:
         logger.error(err)
         return "Provided channel token is not authorized", 401
     logger.info(f"push received: {push=}")
+    cfg.load()
+    logger.debug(
+        f"Push authorized and config loaded in {time.perf_counter() - request_start:.4f}s"
+    )
 
     if push["resource_uri"].startswith("https://www.googleapis.com/calendar"):
         logger.debug("calendar push!")
 
-    dispatched_workflow_run = dispatch_build()
-    logger.debug(f"dispatch_build() result: {dispatched_workflow_run=}")
-    return f"{dispatched_workflow_run.id=}: {dispatched_workflow_run.status=}"
+    push_coalescer = get_push_coalescer()
+    claim = push_coalescer.claim_dispatch(push)
+    if claim is None:
+        logger.info(f"Not dispatching a build for push: {push_coalescer.counts()=}")
+        return f"Push {push['message_number']} coalesced / dropped", 200
+
+    try:
+        dispatch_build()
+    except SuperfluousDispatchException as err:
+        logger.warning(f"SuperfluousDispatchException: {err=}")
+        return "Build already pending, skipped dispatch", 200
+    except Exception:
+        # Google redelivers pushes we fail to acknowledge; those must not be mistaken for duplicates
+        push_coalescer.release(claim)
+        raise
+    push_coalescer.record_dispatch()
+    logger.info(f"Build dispatched for push: {push_coalescer.counts()=}")
+    return f"{cfg.build_workflow_filename} workflow dispatched"
 
 
 def dispatch_build():
@@ -55,21 +78,24 @@ def dispatch_build():
         install_id=int(cfg.githubapp_install_id),
     )
 
-    workflow_run = dispatch_build_workflow_run(
+    # Acknowledge as soon as GitHub accepts the dispatch instead of holding this instance until the run shows up
+    dispatch_build_workflow_run(
         github_client=github_client,
         github_ref="main",
         workflow_filename=cfg.build_workflow_filename,
+        wait_for_run=False,
     )
-    return workflow_run
 
 
 def parse_push(req_headers):
-    webhook_token = get_webhook_token()
     push = {
         h[0].lower().lstrip("x-goog-").replace("-", "_"): h[1]
         for h in req_headers
         if h[0].lower().startswith("x-goog")
     }
+    if not push.get("channel_token"):
+        raise UnauthorizedChannelTokenException("no channel token provided 💥🚨")
+    webhook_token = get_webhook_token()
     logger.debug(
         f"{push['channel_id']=} {push['message_number']=} {push.get('channel_expiration')=}"
     )